@@ -1,111 +1,798 @@
-import base64
-import copy
-import json
-import os
-from password_generator import PasswordGenerator
-from password_manager_crypto import PasswordManagerCrypto
-
-# PasswordManager
-# The PasswordManager class handles the generation, storage, and retrieval of passwords
-
-# Class to provide main functionality of password manager (creating/removing/storing passwords)
-class PasswordManager(object):
-  # Constants
-  _TEXT_ENCODING = "UTF-8"
-  
-  # Instance variables
-  _passwords = []
-  _path = None
-  _master_password = None
-  _generator = PasswordGenerator()
-  _crypto = PasswordManagerCrypto()
-  _saving = False
-  _enc_key = None
-  _salt = None
-  
-  # Constructor
-  # vault_path is the path of the file containing the password vault (created if nonexistant)
-  # master_password is the master password associated with the vault (used to generate key if vault is nonexistant)
-  def __init__(self, vault_path=None, master_password=None):
-    if not vault_path == None and not len(vault_path) == 0 and not master_password == None and not len(master_password) == 0:
-      self._path = vault_path
-      self._master_password = master_password
-      self._load_vault()
-  
-  # Load the password vault using the master password (create if nonexistant)
-  def _load_vault(self):
-    if os.path.isfile(self._path):
-      enc_vault_file = open(self._path, "r")
-      enc_vault_file_contents = enc_vault_file.read()
-      enc_vault_file.close()
-      enc_vault_dict = json.loads(enc_vault_file_contents)
-      enc_key = base64.b64decode(enc_vault_dict["enc_key"].encode(self._TEXT_ENCODING))
-      salt = base64.b64decode(enc_vault_dict["salt"].encode(self._TEXT_ENCODING))
-      enc_passwords = base64.b64decode(enc_vault_dict["enc_passwords"].encode(self._TEXT_ENCODING))
-      self._crypto.unlock_key(self._master_password, enc_key, salt)
-      passwords_json = self._crypto.decrypt(enc_passwords).decode(self._TEXT_ENCODING)
-      self._passwords = json.loads(passwords_json)
-      self._enc_key = enc_key
-      self._salt = salt
-      self._saving = True
-    else:
-      key_details = self._crypto.generate_key(self._master_password)
-      self._enc_key = key_details["enc_key"]
-      self._salt = key_details["salt"]
-      self._saving = True
-      self._save_vault()
-  
-  # Save vault to file if this instance of the manager is using a vault for storage
-  def _save_vault(self):
-    if self._saving:
-      enc_passwords = self._crypto.encrypt(json.dumps(self._passwords).encode(self._TEXT_ENCODING))
-      enc_passwords_b64 = base64.b64encode(enc_passwords).decode(self._TEXT_ENCODING)
-      enc_key_b64 = base64.b64encode(self._enc_key).decode(self._TEXT_ENCODING)
-      salt_b64 = base64.b64encode(self._salt).decode(self._TEXT_ENCODING)
-      vault_contents = {"enc_key": enc_key_b64, "salt": salt_b64, "enc_passwords": enc_passwords_b64}
-      vault_file_contents = json.dumps(vault_contents)
-      vault_file_handle = open(self._path, "w")
-      vault_file_handle.write(vault_file_contents)
-      vault_file_handle.close()
-  
-  # Return if a password exists in the vault (by site string)
-  def password_exists(self, site):
-    for password_entry in self._passwords:
-      if "site" in password_entry and password_entry["site"] == site:
-        return True
-    return False
-  
-  # Generate a password
-  # Takes length, site string, and phrase (arbitrary phrase the user associates with the site)
-  # Length should be at least 1; site string and phrase should be nonempty and of valid characters
-  def generate_password(self, length, site, phrase):
-    if length < 1 or site == None or site == "" or phrase == None or phrase == "":
-      return None
-    password = self._generator.make_password(length, site, phrase)
-    entry = {"site": site, "password": password}
-    if self.password_exists(site):
-      for i in range(len(self._passwords)):
-        if self._passwords[i]["site"] == site:
-          self._passwords[i] = entry
-    else:
-      self._passwords.append(entry)
-    self._save_vault()
-    return password
-  
-  # Deletes a password by site string (does nothing if nonexistant)
-  def delete_password(self, site):
-    if self.password_exists(site):
-      for i in range(len(self._passwords)):
-        if self._passwords[i]["site"] == site:
-          del self._passwords[i]
-          break
-      self._save_vault()
-  
-  # Returns list of passwords.
-  # Each entry is a dictionary with site and password keys.
-  def get_passwords(self):
-    return copy.deepcopy(self._passwords)
-  
-  # Checks and returns whether a given string contains only the characters allowed to be used in this algorithm
-  def is_valid_string(self, phrase):
-    return self._generator.is_valid_string(phrase)
+import base64
+import bisect
+import contextlib
+import hmac
+import json
+import os
+from password_manager_container import PasswordManagerContainer
+from password_manager_entry import PasswordManagerEntry
+from password_manager_journal import PasswordManagerJournal
+from password_manager_lock import PasswordManagerLock
+from password_manager_stats import PasswordManagerStats
+
+# PasswordManager
+# The PasswordManager class handles the generation, storage, and retrieval of passwords
+# The generator, crypto and concurrency modules are imported when first needed to keep startup fast
+
+# Generates the passwords for a chunk of (length, site, phrase) requests; used as the pool worker of PasswordManager.generate_passwords
+# Every chunk gets its own generator seeded from the OS so that pool workers never share random state
+# Returns a list of (site, password, error message) tuples in request order
+def _generate_password_chunk(chunk):
+  import random
+  from password_generator import PasswordGenerator
+  generator = PasswordGenerator(random.Random())
+  results = []
+  for length, site, phrase in chunk:
+    try:
+      results.append((site, generator.make_password(length, site, phrase), None))
+    except ValueError as e:
+      results.append((site, None, str(e)))
+  return results
+
+# Class to provide main functionality of password manager (creating/removing/storing passwords)
+class PasswordManager(object):
+  # Constants
+  _TEXT_ENCODING = "UTF-8"
+  _VAULT_FORMATS = ("json", "journal") # json rewrites the whole vault on every save; journal appends change records to a log
+  _CONTAINER_FORMATS = ("json", "binary") # json stores the vault as JSON with base64 fields; binary stores raw bytes in length-prefixed sections
+  _JOURNAL_SUFFIX = ".journal" # Appended to the vault path to get the journal path
+  _LOCK_SUFFIX = ".lock" # Appended to the vault path to get the path of the lock file shared by all processes using the vault
+  _COMPACT_MIN_BYTES = 64 * 1024 # Journal size below which the journal is never compacted
+  _COMPACT_MAX_BYTES = 16 * 1024 * 1024 # Journal size above which the journal is always compacted
+  _COMPACT_RATIO = 0.5 # Journal to snapshot size ratio above which the journal is compacted
+  _STREAM_ENTRIES = 8192 # Number of entries serialized at a time by streamed snapshots
+  _ENTRY_OVERHEAD = 64 # Approximate bytes of memory used by an entry besides its strings (for get_data_size)
+  
+  # Instance variables (mutable values are created per instance by the constructor, never shared through the class)
+  _passwords = None # Stored entries (PasswordManagerEntry instances) in insertion order
+  _index = None
+  _sorted_sites = None # Sites of the stored entries in sorted order, kept up to date by _put_entry and _remove_entry
+  _search_index = None # Trigram index of the sites, built by the first search and then kept up to date by _put_entry and _remove_entry
+  _data_size = 0
+  _path = None
+  _master_password = None
+  _generator = None
+  _crypto = None
+  _container = None
+  _agent = None # Client of the unlock agent (PasswordManagerAgentClient), if one is used
+  _saving = False
+  _enc_key = None
+  _salt = None
+  _kdf = None # KDF parameters of the key envelope (enc_key and salt), stored in the vault as "kdf"
+  _vault_format = "json"
+  _container_format = "json"
+  _entry_encryption = False
+  _lock = None
+  _generation = 0
+  _snapshot_signature = None
+  _journal = None
+  _journal_id = None
+  _journal_size = 0
+  _snapshot_size = 0
+  _pending_changes = None
+  _batch_depth = 0
+  _batch_undo = None
+  _batch_pending_mark = 0
+  _batch_deferred_saves = 0
+  _saves_avoided = 0
+  
+  # Constructor
+  # vault_path is the path of the file containing the password vault (created if nonexistant)
+  # master_password is the master password associated with the vault (used to generate key if vault is nonexistant)
+  # vault_format is the on-disk layout used if the vault is created ("json" or "journal"); existing vaults keep their format (see convert_vault)
+  # entry_encryption (used if the vault is created) seals each password separately so it is only decrypted when accessed (see set_entry_encryption)
+  # container_format is the file container used if the vault is created ("json" or "binary"); existing vaults are detected (see convert_container)
+  # agent (optional) is a PasswordManagerAgentClient: the unlocked data key is asked from the unlock agent before deriving it from the master password, and given to the agent after deriving it
+  def __init__(self, vault_path=None, master_password=None, vault_format="json", entry_encryption=False, container_format="json", agent=None):
+    if not vault_format in self._VAULT_FORMATS:
+      raise ValueError("Vault format must be one of: " + ", ".join(self._VAULT_FORMATS) + ".")
+    if not container_format in self._CONTAINER_FORMATS:
+      raise ValueError("Container format must be one of: " + ", ".join(self._CONTAINER_FORMATS) + ".")
+    self._passwords = []
+    self._index = {}
+    self._sorted_sites = []
+    self._search_index = None
+    self._data_size = 0
+    self._pending_changes = []
+    self._generator = None
+    self._crypto = None
+    self._container = PasswordManagerContainer()
+    self._agent = agent
+    self._vault_format = vault_format
+    self._entry_encryption = entry_encryption
+    self._container_format = container_format
+    if not vault_path == None and not len(vault_path) == 0 and not master_password == None and not len(master_password) == 0:
+      self._path = vault_path
+      self._master_password = master_password
+      from password_manager_crypto import PasswordManagerCrypto
+      self._crypto = PasswordManagerCrypto()
+      self._journal = PasswordManagerJournal(vault_path + self._JOURNAL_SUFFIX)
+      self._lock = PasswordManagerLock(vault_path + self._LOCK_SUFFIX)
+      self._load_vault()
+  
+  # Load the password vault using the master password (create if nonexistant)
+  def _load_vault(self):
+    start = PasswordManagerStats.start()
+    with self._lock.shared():
+      exists = os.path.isfile(self._path)
+      if exists:
+        self._read_vault()
+    if not exists:
+      with self._lock.exclusive():
+        if os.path.isfile(self._path):
+          self._read_vault()
+        else:
+          key_details = self._crypto.generate_key(self._master_password)
+          self._enc_key = key_details["enc_key"]
+          self._salt = key_details["salt"]
+          self._kdf = key_details["kdf"]
+          self._saving = True
+          self._write_snapshot()
+    self._saving = True
+    PasswordManagerStats.stop("vault.load", start)
+  
+  # Read the vault file (and journal) into this instance, replacing the entries held in memory
+  # The key is only unlocked again (PBKDF2) if the key envelope differs from the one already unlocked, and not at all if the unlock agent holds it
+  # The caller must hold the vault lock
+  def _read_vault(self):
+    with self._container.read(self._path) as (container_format, enc_vault_dict, vault_size):
+      enc_key = bytes(enc_vault_dict["enc_key"])
+      salt = bytes(enc_vault_dict["salt"])
+      kdf = enc_vault_dict.get("kdf", self._crypto.get_default_kdf())
+      unlocked = None
+      if not enc_key == self._enc_key or not salt == self._salt or not kdf == self._kdf:
+        unlocked = self._unlock_key(enc_key, salt, kdf)
+      try:
+        passwords_json = self._crypto.decrypt(enc_vault_dict["enc_passwords"])
+      except ValueError:
+        if not unlocked == "agent":
+          raise
+        # The key held by the agent does not open this vault; derive it from the master password instead
+        unlocked = self._unlock_key(enc_key, salt, kdf, False)
+        passwords_json = self._crypto.decrypt(enc_vault_dict["enc_passwords"])
+    if unlocked == "password" and not self._agent == None:
+      key = self._crypto.export_key()
+      try:
+        self._agent.add_key(self._path, salt, key, self._master_password)
+      finally:
+        key[:] = bytes(len(key))
+    parse_start = PasswordManagerStats.start()
+    self._passwords = PasswordManagerEntry.loads(passwords_json)
+    PasswordManagerStats.stop("vault.json_parse", parse_start, len(passwords_json))
+    self._rebuild_index()
+    self._enc_key = enc_key
+    self._salt = salt
+    self._kdf = kdf
+    self._container_format = container_format
+    self._vault_format = enc_vault_dict.get("format", "json")
+    self._entry_encryption = enc_vault_dict.get("entry_encryption", False)
+    self._journal_id = enc_vault_dict.get("journal_id")
+    self._generation = enc_vault_dict.get("generation", 0)
+    self._snapshot_size = vault_size
+    self._snapshot_signature = self._get_snapshot_signature()
+    self._journal_size = 0
+    if self._vault_format == "journal":
+      self._replay_journal()
+    self._pending_changes = []
+  
+  # Unlocks the data key of the key envelope (enc_key, salt, kdf) into the crypto instance
+  # The key is asked from the unlock agent first (if use_agent is true and an agent is used); otherwise it is derived from the master password
+  # Returns "agent" or "password" depending on where the key came from
+  # ValueError thrown if the master password does not unlock the key
+  def _unlock_key(self, enc_key, salt, kdf, use_agent=True):
+    if use_agent and not self._agent == None:
+      key = self._agent.get_key(self._path, salt, self._master_password)
+      if not key == None:
+        try:
+          self._crypto.import_key(key)
+        finally:
+          key[:] = bytes(len(key))
+        return "agent"
+    self._crypto.unlock_key(self._master_password, enc_key, salt, kdf)
+    return "password"
+  
+  # Apply the change records in the journal (after the records already applied) on top of the loaded entries
+  def _replay_journal(self):
+    records, self._journal_size = self._journal.read(self._journal_id, self._journal_size)
+    for record in records:
+      change = json.loads(self._crypto.decrypt(record).decode(self._TEXT_ENCODING))
+      if change["op"] == "put":
+        self._put_entry(PasswordManagerEntry(change["site"], change["password"]))
+      elif change["op"] == "delete":
+        self._remove_entry(change["site"])
+  
+  # Returns a value that changes whenever the vault file is replaced (every write replaces it)
+  def _get_snapshot_signature(self):
+    vault_stat = os.stat(self._path)
+    return (vault_stat.st_ino, vault_stat.st_dev, vault_stat.st_size, vault_stat.st_mtime_ns)
+  
+  # Context manager that takes the exclusive vault lock for a write
+  # If another process changed the vault since this instance last read or wrote it, the changes made here since the last save are merged into the current vault first
+  @contextlib.contextmanager
+  def _locked_for_write(self):
+    with self._lock.exclusive():
+      self._merge_from_disk()
+      yield
+  
+  # Bring the entries up to date with the vault on disk, keeping the changes made since the last save (they win per site)
+  # Only the new journal records are read if the snapshot is unchanged; otherwise the vault is read again
+  # The caller must hold the exclusive vault lock
+  def _merge_from_disk(self):
+    if not self._get_snapshot_signature() == self._snapshot_signature:
+      # Keep the pending changes as plaintext so that they survive a change of key or entry encryption by the other process
+      pending = []
+      for change in self._pending_changes:
+        if change[0] == "put":
+          pending.append(("put", change[1].site, self._open_password(change[1].password)))
+        else:
+          pending.append(change)
+      self._read_vault()
+      for change in pending:
+        if change[0] == "put":
+          self._put_entry(self._make_entry(change[1], change[2]))
+        else:
+          self._remove_entry(change[1])
+    elif self._vault_format == "journal" and not self._journal.size() == self._journal_size:
+      pending = self._pending_changes
+      self._pending_changes = []
+      self._replay_journal()
+      for change in pending:
+        if change[0] == "put":
+          self._put_entry(change[1])
+        else:
+          self._remove_entry(change[1])
+      self._pending_changes = pending
+  
+  # Save vault to file if this instance of the manager is using a vault for storage
+  # Journal-format vaults only append the changes made since the last save; other vaults are rewritten entirely
+  # Inside a batch the save is deferred and written once when the batch commits
+  def _save_vault(self):
+    if self._batch_depth > 0:
+      self._batch_deferred_saves += 1
+      return
+    if self._saving:
+      start = PasswordManagerStats.start()
+      with self._locked_for_write():
+        if self._vault_format == "journal" and not self._journal_id == None and self._journal_size > 0:
+          self._append_journal()
+        else:
+          self._write_snapshot()
+      PasswordManagerStats.stop("vault.save", start)
+  
+  # Write the complete vault to file, replacing it atomically and advancing its generation counter
+  # For journal-format vaults this starts a new empty journal, folding the old journal into the snapshot
+  # If streamed is true the entries are serialized, encrypted and written piece by piece (two passes, see PasswordManagerCrypto.encrypt_stream) instead of being held in memory as one serialized and one encrypted copy
+  # The caller must hold the exclusive vault lock
+  def _write_snapshot(self, streamed=False):
+    vault_contents = {"enc_key": self._enc_key, "salt": self._salt, "kdf": self._kdf, "generation": self._generation + 1}
+    journal_id = None
+    if self._vault_format == "journal":
+      journal_id = os.urandom(16).hex()
+      vault_contents["format"] = self._vault_format
+      vault_contents["journal_id"] = journal_id
+    if self._entry_encryption:
+      vault_contents["entry_encryption"] = True
+    if streamed:
+      enc_passwords_length, enc_passwords_chunks = self._crypto.encrypt_stream(self._make_passwords_json_chunks)
+      self._snapshot_size = self._container.write_streamed(self._path, vault_contents, enc_passwords_chunks, enc_passwords_length, self._container_format)
+    else:
+      start = PasswordManagerStats.start()
+      passwords_json = PasswordManagerEntry.dumps(self._passwords).encode(self._TEXT_ENCODING)
+      PasswordManagerStats.stop("vault.json_serialize", start, len(passwords_json))
+      vault_contents["enc_passwords"] = self._crypto.encrypt(passwords_json)
+      self._snapshot_size = self._container.write(self._path, vault_contents, self._container_format)
+    self._snapshot_signature = self._get_snapshot_signature()
+    self._generation += 1
+    self._pending_changes = []
+    self._journal_id = journal_id
+    self._journal_size = 0
+    if not journal_id == None:
+      self._journal_size = self._journal.reset(journal_id)
+  
+  # Yields the JSON serialization of the entries (the same text as PasswordManagerEntry.dumps) as encoded pieces of _STREAM_ENTRIES entries each
+  # Each piece is serialized from a slice of the entries, and the pieces are joined the way json.dumps joins list items
+  def _make_passwords_json_chunks(self):
+    if len(self._passwords) == 0:
+      yield b"[]"
+      return
+    for i in range(0, len(self._passwords), self._STREAM_ENTRIES):
+      piece = PasswordManagerEntry.dumps(self._passwords[i:i + self._STREAM_ENTRIES])[1:-1]
+      if i == 0:
+        piece = "[" + piece
+      else:
+        piece = ", " + piece
+      if i + self._STREAM_ENTRIES >= len(self._passwords):
+        piece += "]"
+      yield piece.encode(self._TEXT_ENCODING)
+  
+  # Append the changes made since the last save to the journal as individually encrypted records
+  # Compacts the journal into a new snapshot once it grows past the size thresholds
+  # Compaction is best-effort: the changes are saved once appended, so a failed snapshot write (such as a full disk) is not raised and compaction is retried at the next save
+  # The caller must hold the exclusive vault lock
+  def _append_journal(self):
+    if len(self._pending_changes) == 0:
+      return
+    records = []
+    for change in self._pending_changes:
+      if change[0] == "put":
+        record = {"op": "put", "site": change[1].site, "password": change[1].password}
+      else:
+        record = {"op": "delete", "site": change[1]}
+      records.append(self._crypto.encrypt(json.dumps(record).encode(self._TEXT_ENCODING)))
+    self._journal_size = self._journal.append(records, self._journal_size)
+    self._pending_changes = []
+    if self._journal_size > self._COMPACT_MAX_BYTES or (self._journal_size > self._COMPACT_MIN_BYTES and self._journal_size > self._snapshot_size * self._COMPACT_RATIO):
+      try:
+        self._write_snapshot()
+      except OSError:
+        pass
+  
+  # Bring the entries up to date with the vault on disk if another process saved it since this instance last read or wrote it
+  # Only a file status check (and journal size check) is made if nothing changed
+  # Raises ValueError if the master password of this instance no longer unlocks the vault
+  def refresh(self):
+    if self._saving:
+      with self._lock.shared():
+        self._merge_from_disk()
+  
+  # Returns the approximate number of bytes of memory used by the stored entries
+  def get_data_size(self):
+    return self._data_size
+  
+  # Forget the unlocked vault: the data key is overwritten, and the entries and master password are dropped
+  # Python strings cannot be overwritten in place, so the entries are only released to the garbage collector
+  # The instance cannot be used afterwards; changes are saved as they are made, so nothing is lost
+  def close(self):
+    if not self._crypto == None:
+      self._crypto.clear_key()
+    self._saving = False
+    self._master_password = None
+    self._enc_key = None
+    self._passwords = []
+    self._index = {}
+    self._sorted_sites = []
+    self._search_index = None
+    self._data_size = 0
+    self._pending_changes = []
+  
+  # Returns the generation counter of the vault, advanced by every full write of the vault file (by any process)
+  def get_generation(self):
+    return self._generation
+  
+  # Fold the journal of a journal-format vault into a new snapshot (does nothing for other vaults)
+  def compact_vault(self):
+    if self._saving and self._vault_format == "journal":
+      if self._batch_depth > 0:
+        raise ValueError("The vault cannot be compacted inside a batch.")
+      with self._locked_for_write():
+        self._write_snapshot()
+  
+  # Converts the vault to another on-disk format ("json" or "journal") and rewrites it
+  def convert_vault(self, vault_format):
+    if not vault_format in self._VAULT_FORMATS:
+      raise ValueError("Vault format must be one of: " + ", ".join(self._VAULT_FORMATS) + ".")
+    if self._batch_depth > 0:
+      raise ValueError("The vault cannot be converted inside a batch.")
+    if not self._saving:
+      self._vault_format = vault_format
+      return
+    with self._locked_for_write():
+      self._vault_format = vault_format
+      self._write_snapshot()
+      if not vault_format == "journal":
+        self._journal.remove()
+  
+  # Returns the on-disk format of the vault ("json" or "journal")
+  def get_vault_format(self):
+    return self._vault_format
+  
+  # Converts the vault file to another container ("json" or "binary") and rewrites it
+  def convert_container(self, container_format):
+    if self._batch_depth > 0:
+      raise ValueError("The vault cannot be converted inside a batch.")
+    if not container_format in self._CONTAINER_FORMATS:
+      raise ValueError("Container format must be one of: " + ", ".join(self._CONTAINER_FORMATS) + ".")
+    if not self._saving:
+      self._container_format = container_format
+      return
+    with self._locked_for_write():
+      self._container_format = container_format
+      self._write_snapshot()
+  
+  # Returns the file container of the vault ("json" or "binary")
+  def get_container_format(self):
+    return self._container_format
+  
+  # Changes the master password of the vault to new_master_password
+  # Only the key envelope is replaced: the data key is encrypted again under a key derived from the new password with a new salt, and the encrypted entries and journal are copied unchanged (no entry is decrypted or encrypted)
+  # kdf_algorithm and kdf_iterations (optional) change the KDF parameters stored with the envelope, for example to raise the iteration count; the current ones are kept otherwise
+  # The vault file is replaced atomically; other processes using the vault need the new master password from then on
+  # ValueError thrown if old_master_password is not the master password, if the new one is empty or if the KDF parameters are not supported
+  def change_master_password(self, old_master_password, new_master_password, kdf_algorithm=None, kdf_iterations=None):
+    if self._batch_depth > 0:
+      raise ValueError("The master password cannot be changed inside a batch.")
+    if not self._saving:
+      raise ValueError("There is no vault to change the master password of.")
+    if not self.check_master_password(old_master_password):
+      raise ValueError("The master password is incorrect.")
+    if new_master_password == None or len(new_master_password) == 0:
+      raise ValueError("The new master password must be nonempty.")
+    with self._locked_for_write():
+      kdf = dict(self._kdf)
+      if not kdf_algorithm == None:
+        kdf["algorithm"] = kdf_algorithm
+      if not kdf_iterations == None:
+        kdf["iterations"] = kdf_iterations
+      key_details = self._crypto.wrap_key(new_master_password, kdf)
+      with self._container.read(self._path) as (container_format, vault_contents, vault_size):
+        vault_contents = dict(vault_contents)
+        vault_contents.update({"enc_key": key_details["enc_key"], "salt": key_details["salt"], "kdf": key_details["kdf"], "generation": self._generation + 1})
+        self._snapshot_size = self._container.write(self._path, vault_contents, container_format)
+      self._snapshot_signature = self._get_snapshot_signature()
+      self._generation += 1
+      self._enc_key = key_details["enc_key"]
+      self._salt = key_details["salt"]
+      self._kdf = key_details["kdf"]
+      self._master_password = new_master_password
+  
+  # Returns whether master_password is the current master password of the vault, without a key derivation
+  # Used by holders of an open manager (such as VaultPool) to check a password given again after the manager may have changed it
+  def check_master_password(self, master_password):
+    if master_password == None or self._master_password == None:
+      return False
+    return hmac.compare_digest(master_password.encode(self._TEXT_ENCODING), self._master_password.encode(self._TEXT_ENCODING))
+  
+  # Returns the KDF parameters of the vault: a dictionary with algorithm and iterations keys
+  def get_kdf(self):
+    if self._kdf == None:
+      return None
+    return dict(self._kdf)
+  
+  # Replaces the data key of the vault with a new random key, re-encrypting everything that was encrypted with the old one
+  # The entries are serialized, encrypted and written in a streaming pass (see _write_snapshot), sealed entries are sealed again one at a time, and a journal is folded into the new snapshot
+  # The vault file is replaced atomically; if writing fails, the old key and vault stay in use
+  def rotate_data_key(self):
+    if self._batch_depth > 0:
+      raise ValueError("The data key cannot be rotated inside a batch.")
+    if not self._saving:
+      return
+    from password_manager_crypto import PasswordManagerCrypto
+    with self._locked_for_write():
+      old_crypto = self._crypto
+      old_passwords = self._passwords
+      old_envelope = (self._enc_key, self._salt)
+      new_crypto = PasswordManagerCrypto()
+      key_details = new_crypto.generate_key(self._master_password, self._kdf)
+      try:
+        if self._entry_encryption:
+          self._passwords = []
+          for entry in old_passwords:
+            self._crypto = old_crypto
+            password = self._unseal_password(entry.password)
+            self._crypto = new_crypto
+            self._passwords.append(PasswordManagerEntry(entry.site, self._seal_password(password)))
+        self._crypto = new_crypto
+        self._enc_key = key_details["enc_key"]
+        self._salt = key_details["salt"]
+        self._write_snapshot(streamed=True)
+      except BaseException:
+        self._crypto = old_crypto
+        self._passwords = old_passwords
+        self._enc_key, self._salt = old_envelope
+        new_crypto.clear_key()
+        raise
+      old_crypto.clear_key()
+  
+  # Turns per-entry encryption on or off and rewrites the vault
+  # With per-entry encryption each stored password is sealed separately and only decrypted when it is accessed
+  def set_entry_encryption(self, enabled):
+    if self._batch_depth > 0:
+      raise ValueError("Entry encryption cannot be changed inside a batch.")
+    if not self._saving:
+      self._set_entry_encryption(enabled)
+      return
+    with self._locked_for_write():
+      self._set_entry_encryption(enabled)
+      self._write_snapshot()
+  
+  # Seals or unseals every stored password in memory for set_entry_encryption
+  def _set_entry_encryption(self, enabled):
+    if enabled == self._entry_encryption:
+      return
+    for i in range(len(self._passwords)):
+      entry = self._passwords[i]
+      if enabled:
+        self._passwords[i] = PasswordManagerEntry(entry.site, self._seal_password(entry.password))
+      else:
+        self._passwords[i] = PasswordManagerEntry(entry.site, self._unseal_password(entry.password))
+    self._entry_encryption = enabled
+  
+  # Returns whether passwords are sealed separately (per-entry encryption)
+  def get_entry_encryption(self):
+    return self._entry_encryption
+  
+  # Encrypts a single password with the data key and returns it as a base64 string
+  def _seal_password(self, password):
+    return base64.b64encode(self._crypto.encrypt(password.encode(self._TEXT_ENCODING))).decode(self._TEXT_ENCODING)
+  
+  # Decrypts a single password sealed by _seal_password
+  def _unseal_password(self, sealed_password):
+    return self._crypto.decrypt(base64.b64decode(sealed_password.encode(self._TEXT_ENCODING))).decode(self._TEXT_ENCODING)
+  
+  # Returns a stored entry for a site and password, sealing the password if per-entry encryption is on
+  def _make_entry(self, site, password):
+    if self._entry_encryption:
+      return PasswordManagerEntry(site, self._seal_password(password))
+    return PasswordManagerEntry(site, password)
+  
+  # Returns the plaintext of a stored password, decrypting it if per-entry encryption is on
+  def _open_password(self, stored_password):
+    if self._entry_encryption:
+      return self._unseal_password(stored_password)
+    return stored_password
+  
+  # Rebuild the site index from the stored entries (site string -> position in _passwords)
+  # A later entry for the same site wins, matching how replacement works
+  def _rebuild_index(self):
+    self._index = {}
+    self._data_size = 0
+    for i in range(len(self._passwords)):
+      self._index[self._passwords[i].site] = i
+      self._data_size += self._get_entry_size(self._passwords[i])
+    self._sorted_sites = sorted(self._index)
+    self._search_index = None
+  
+  # Returns the approximate number of bytes of memory used by an entry
+  def _get_entry_size(self, entry):
+    return len(entry.site) + len(entry.password) + self._ENTRY_OVERHEAD
+  
+  # Insert or replace the entry for a site, keeping the index up to date
+  def _put_entry(self, entry):
+    position = self._index.get(entry.site)
+    if not self._batch_undo == None:
+      self._batch_undo.append((entry.site, None if position == None else self._passwords[position]))
+    if position == None:
+      self._index[entry.site] = len(self._passwords)
+      self._passwords.append(entry)
+      bisect.insort(self._sorted_sites, entry.site)
+      if not self._search_index == None:
+        self._search_index.add(entry.site)
+    else:
+      # Keep a single string per site, shared by the entry, the site index, the sorted sites and the search index (a new entry, since entries are read-only and may be held by the caller)
+      if not entry.site is self._passwords[position].site:
+        entry = PasswordManagerEntry(self._passwords[position].site, entry.password)
+      self._data_size -= self._get_entry_size(self._passwords[position])
+      self._passwords[position] = entry
+    self._data_size += self._get_entry_size(entry)
+    if self._saving:
+      self._pending_changes.append(("put", entry))
+  
+  # Remove the entry for a site by moving the last entry into its slot, keeping the index up to date
+  # Returns whether an entry was removed
+  def _remove_entry(self, site):
+    position = self._index.pop(site, None)
+    if position == None:
+      return False
+    if not self._batch_undo == None:
+      self._batch_undo.append((site, self._passwords[position]))
+    self._data_size -= self._get_entry_size(self._passwords[position])
+    del self._sorted_sites[bisect.bisect_left(self._sorted_sites, site)]
+    if not self._search_index == None:
+      self._search_index.remove(site)
+    last = self._passwords.pop()
+    if position < len(self._passwords):
+      self._passwords[position] = last
+      self._index[last.site] = position
+    if self._saving:
+      self._pending_changes.append(("delete", site))
+    return True
+  
+  # Context manager that groups changes into a single transaction
+  # Changes made inside the batch stay in memory and the vault is saved once when the batch exits normally
+  # If an exception escapes the batch, every change made inside it is rolled back and nothing is saved
+  # Nested batches join the outermost one
+  @contextlib.contextmanager
+  def batch(self):
+    if self._batch_depth > 0:
+      self._batch_depth += 1
+      try:
+        yield self
+      finally:
+        self._batch_depth -= 1
+      return
+    self._batch_depth = 1
+    self._batch_undo = []
+    self._batch_pending_mark = len(self._pending_changes)
+    self._batch_deferred_saves = 0
+    try:
+      yield self
+    except BaseException:
+      self._rollback_batch()
+      raise
+    finally:
+      self._batch_depth = 0
+    undo = self._batch_undo
+    self._batch_undo = None
+    if self._batch_deferred_saves > 0:
+      self._saves_avoided += self._batch_deferred_saves - 1
+      self._batch_deferred_saves = 0
+      try:
+        self._save_vault()
+      except BaseException:
+        self._batch_undo = undo
+        self._rollback_batch()
+        raise
+  
+  # Undo the changes recorded in the current batch (most recent first)
+  def _rollback_batch(self):
+    undo = self._batch_undo
+    self._batch_undo = None
+    self._batch_deferred_saves = 0
+    for site, previous_entry in reversed(undo):
+      if previous_entry == None:
+        self._remove_entry(site)
+      else:
+        self._put_entry(previous_entry)
+    del self._pending_changes[self._batch_pending_mark:]
+  
+  # Returns the number of vault saves that batches have avoided so far
+  def get_saves_avoided(self):
+    return self._saves_avoided
+  
+  # Return if a password exists in the vault (by site string)
+  def password_exists(self, site):
+    return site in self._index
+  
+  # Returns the password stored for a site string (None if nonexistant)
+  def get_password(self, site):
+    position = self._index.get(site)
+    if position == None:
+      return None
+    return self._open_password(self._passwords[position].password)
+  
+  # Generate a password
+  # Takes length, site string, and phrase (arbitrary phrase the user associates with the site)
+  # Length should be at least 1; site string and phrase should be nonempty and of valid characters
+  def generate_password(self, length, site, phrase):
+    if length < 1 or site == None or site == "" or phrase == None or phrase == "":
+      return None
+    password = self._get_generator().make_password(length, site, phrase)
+    self._put_entry(self._make_entry(site, password))
+    self._save_vault()
+    return password
+  
+  # Stores a given password (such as an imported one) for a site string, replacing any password stored for it; the password is sealed if per-entry encryption is on
+  # The vault is saved (when the batch commits inside a batch) unless save is false, in which case the change stays in memory until the next save (see save())
+  # Raises ValueError if site or password is not a nonempty string of the characters allowed by the generator
+  def set_password(self, site, password, save=True):
+    if not isinstance(site, str) or site == "" or not self.is_valid_string(site) or not isinstance(password, str) or password == "" or not self.is_valid_string(password):
+      raise ValueError("Site and password must be nonempty strings of lowercase letters, uppercase letters, numbers, and special keyboard characters.")
+    self._put_entry(self._make_entry(site, password))
+    if save:
+      self._save_vault()
+  
+  # Generate many passwords at once
+  # requests is an iterable of (length, site, phrase) tuples, validated like the arguments of generate_password
+  # The password generation is spread over a pool: executor is "process", "thread" or an existing concurrent.futures.Executor (which is left running)
+  # workers is the pool size for a new pool (default chosen by concurrent.futures); chunk_size is the number of requests sent to a worker at a time
+  # The generated passwords are stored in request order (a later request for the same site replaces an earlier one) and the vault is saved once
+  # Returns a list with one dictionary per request, in request order: site and password keys on success, site and error keys on failure (site is None if the request is not a (length, site, phrase) tuple)
+  def generate_passwords(self, requests, executor="process", workers=None, chunk_size=None):
+    import concurrent.futures
+    requests = list(requests)
+    results = [None] * len(requests)
+    valid_requests = []
+    valid_positions = []
+    for i in range(len(requests)):
+      if not isinstance(requests[i], (tuple, list)) or not len(requests[i]) == 3:
+        results[i] = {"site": None, "error": "A request must be a (length, site, phrase) tuple."}
+        continue
+      length, site, phrase = requests[i]
+      if not isinstance(length, int) or isinstance(length, bool) or not isinstance(site, str) or not isinstance(phrase, str):
+        results[i] = {"site": site, "error": "Length must be an integer, and site and phrase must be strings."}
+      elif length < 1 or site == "" or phrase == "":
+        results[i] = {"site": site, "error": "Length must be at least 1, and site and phrase must be nonempty."}
+      else:
+        valid_requests.append((length, site, phrase))
+        valid_positions.append(i)
+    if len(valid_requests) > 0:
+      if executor == "process":
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+      elif executor == "thread":
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+      elif isinstance(executor, concurrent.futures.Executor):
+        pool = executor
+      else:
+        raise ValueError("Executor must be \"process\", \"thread\" or a concurrent.futures.Executor.")
+      if chunk_size == None:
+        chunk_size = max(1, len(valid_requests) // ((workers or os.cpu_count() or 1) * 4))
+      chunks = [valid_requests[i:i + chunk_size] for i in range(0, len(valid_requests), chunk_size)]
+      try:
+        chunk_results = list(pool.map(_generate_password_chunk, chunks))
+      finally:
+        if not pool is executor:
+          pool.shutdown()
+      position = 0
+      with self.batch():
+        for chunk_result in chunk_results:
+          for site, password, error in chunk_result:
+            if error == None:
+              self._put_entry(self._make_entry(site, password))
+              results[valid_positions[position]] = {"site": site, "password": password}
+            else:
+              results[valid_positions[position]] = {"site": site, "error": error}
+            position += 1
+        self._save_vault()
+    return results
+  
+  # Deletes a password by site string (does nothing if nonexistant)
+  # The vault is saved unless save is false (see set_password)
+  # Returns whether a password was deleted
+  def delete_password(self, site, save=True):
+    if not self._remove_entry(site):
+      return False
+    if save:
+      self._save_vault()
+    return True
+  
+  # Saves the vault, writing the changes made with save=False (a journal vault appends only the changes since its last save; other vaults are rewritten entirely)
+  # Inside a batch the save is made when the batch commits
+  def save(self):
+    self._save_vault()
+  
+  # Returns list of passwords.
+  # Each entry is a new dictionary with site and password keys.
+  def get_passwords(self):
+    if self._entry_encryption:
+      return [{"site": entry.site, "password": self._open_password(entry.password)} for entry in self._passwords]
+    return [entry.to_dict() for entry in self._passwords]
+  
+  # Yields the entries in order of site, each as a read-only mapping with site and password keys (a PasswordManagerEntry)
+  # start_after (optional) skips sites up to and including it, so a page can continue where the previous one stopped
+  # limit (optional) is the maximum number of entries yielded; prefix (optional) yields only sites starting with it
+  # Entries are not copied (unless they are sealed); changes made between steps are picked up by the following steps
+  def iter_passwords(self, start_after=None, limit=None, prefix=None):
+    last_site = start_after
+    count = 0
+    while limit == None or count < limit:
+      if last_site == None:
+        position = 0
+      else:
+        position = bisect.bisect_right(self._sorted_sites, last_site)
+      if not prefix == None and (last_site == None or last_site < prefix):
+        position = max(position, bisect.bisect_left(self._sorted_sites, prefix))
+      if position >= len(self._sorted_sites):
+        return
+      site = self._sorted_sites[position]
+      if not prefix == None and not site.startswith(prefix):
+        return
+      entry = self._passwords[self._index[site]]
+      if self._entry_encryption:
+        entry = PasswordManagerEntry(site, self._open_password(entry.password))
+      yield entry
+      last_site = site
+      count += 1
+  
+  # Returns up to limit sites matching query, best first: an exact match, then sites starting with or containing the query, then similar sites (case-insensitive)
+  # The trigram index behind the search is built by the first search (the search module is imported then)
+  def search(self, query, limit=10):
+    if self._search_index == None:
+      from password_manager_search import PasswordManagerSearchIndex
+      start = PasswordManagerStats.start()
+      self._search_index = PasswordManagerSearchIndex(self._sorted_sites)
+      PasswordManagerStats.stop("search.build", start)
+    start = PasswordManagerStats.start()
+    results = self._search_index.search(query, limit)
+    PasswordManagerStats.stop("search.query", start)
+    return results
+  
+  # Checks and returns whether a given string contains only the characters allowed to be used in this algorithm
+  def is_valid_string(self, phrase):
+    return self._get_generator().is_valid_string(phrase)
+  
+  # Returns the password generator of this instance, creating it on first use
+  def _get_generator(self):
+    if self._generator == None:
+      from password_generator import PasswordGenerator
+      self._generator = PasswordGenerator()
+    return self._generator
@@ -0,0 +1,248 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import socket
+import stat
+import struct
+import threading
+import time
+
+# PasswordManagerAgent
+# Local daemon that keeps unlocked data keys in memory so that repeated runs of the password manager skip the key derivation (like ssh-agent)
+
+# Class to serve unlocked vault data keys over a Unix socket that only its owner can use
+# Keys are held per vault, keyed by the absolute vault path and the salt of the key envelope (a new envelope, after a master password change or key rotation, has a new salt)
+# Each key expires ttl seconds after it was added; "lock" forgets every key and "forget" the keys of one vault
+# The agent never stores a master password: it keeps an HMAC-SHA256 of it keyed with the data key, and only returns a key to a client that sends the same master password
+# Requests and responses are JSON objects, one per line (see PasswordManagerAgentClient):
+# {"op": "add", "path": ..., "salt": ..., "key": ..., "password": ...} - stores an unlocked key (salt and key in base64), replacing any key held for the vault
+# {"op": "get", "path": ..., "salt": ..., "password": ...} - returns {"key": ...} if the key is held and the master password matches
+# {"op": "forget", "path": ...} - forgets the keys of a vault; {"op": "lock"} - forgets every key
+# {"op": "list"} - returns the held vaults with the seconds left before they expire; {"op": "stop"} - forgets every key and stops the agent
+# Every response has an "ok" key, plus "error" on failure
+class PasswordManagerAgent(object):
+  # Constants
+  _TEXT_ENCODING = "UTF-8"
+  _DEFAULT_TTL = 900.0 # Seconds a key is kept after it was added
+  _BACKLOG = 16
+  _POLL_INTERVAL = 1.0 # Seconds between checks for expired keys and stop requests while no client connects
+  _CLIENT_TIMEOUT = 5.0 # Seconds a client may take to send a request
+  _MAX_REQUEST = 64 * 1024 # Maximum length of a request line in bytes
+  
+  # Instance variables
+  _socket_path = None
+  _ttl = 0.0
+  _server = None
+  _lock = None
+  _keys = None # (absolute vault path, base64 salt) -> dictionary with key (bytearray), verifier and expires (time.monotonic value) keys
+  _stopping = False
+  
+  # Constructor
+  # socket_path is the path of the Unix socket to listen on
+  # ttl is the number of seconds a key is kept after it was added
+  def __init__(self, socket_path, ttl=_DEFAULT_TTL):
+    if ttl <= 0:
+      raise ValueError("The key lifetime must be positive.")
+    self._socket_path = socket_path
+    self._ttl = float(ttl)
+    self._server = None
+    self._lock = threading.Lock()
+    self._keys = {}
+    self._stopping = False
+  
+  # Returns the path of the socket of the agent
+  def get_socket_path(self):
+    return self._socket_path
+  
+  # Creates the socket (readable and writable by its owner only) and starts listening, so that clients can connect before serve() runs
+  # Raises OSError if the socket cannot be created (for example if another agent is listening on it, or if something other than a socket exists at its path)
+  def bind(self):
+    if os.path.lexists(self._socket_path):
+      if not stat.S_ISSOCK(os.lstat(self._socket_path).st_mode):
+        raise OSError(self._socket_path + " exists and is not a socket.")
+      probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      try:
+        probe.connect(self._socket_path)
+      except OSError:
+        # Left over by an agent that did not stop cleanly
+        os.remove(self._socket_path)
+      else:
+        raise OSError("Another agent is listening on " + self._socket_path + ".")
+      finally:
+        probe.close()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The umask makes the socket private from the moment it is created; chmod below does not depend on it
+    old_umask = os.umask(0o177)
+    try:
+      server.bind(self._socket_path)
+    except BaseException:
+      server.close()
+      raise
+    finally:
+      os.umask(old_umask)
+    os.chmod(self._socket_path, 0o600)
+    server.listen(self._BACKLOG)
+    server.settimeout(self._POLL_INTERVAL)
+    self._server = server
+  
+  # Serves clients until stop() is called or a stop request arrives, then forgets every key and removes the socket
+  # Each client is served by its own thread
+  def serve(self):
+    if self._server == None:
+      self.bind()
+    try:
+      while not self._stopping:
+        self._expire()
+        try:
+          connection = self._server.accept()[0]
+        except socket.timeout:
+          continue
+        thread = threading.Thread(target=self._serve_client, args=(connection,))
+        thread.daemon = True
+        thread.start()
+    finally:
+      self.close()
+  
+  # Makes serve() return within _POLL_INTERVAL seconds (safe to call from a signal handler or another thread)
+  def stop(self):
+    self._stopping = True
+  
+  # Forgets every key, closes the socket and removes the socket file
+  def close(self):
+    self._forget()
+    if not self._server == None:
+      self._server.close()
+      self._server = None
+      if os.path.exists(self._socket_path):
+        os.remove(self._socket_path)
+  
+  # Returns the number of keys held
+  def size(self):
+    with self._lock:
+      return len(self._keys)
+  
+  # Reads request lines from a client and answers each of them
+  def _serve_client(self, connection):
+    reader = None
+    try:
+      connection.settimeout(self._CLIENT_TIMEOUT)
+      if not self._is_owner(connection):
+        return
+      reader = connection.makefile("rb")
+      while not self._stopping:
+        line = reader.readline(self._MAX_REQUEST + 1)
+        if len(line) == 0:
+          break
+        if len(line) > self._MAX_REQUEST:
+          self._send(connection, {"ok": False, "error": "The request is too long."})
+          break
+        self._send(connection, self._execute(line))
+    except OSError:
+      pass
+    finally:
+      if not reader == None:
+        reader.close()
+      connection.close()
+  
+  # Checks that the peer of a connection runs as the same user as the agent, where the OS reports it (SO_PEERCRED)
+  # The socket permissions already keep other users out; this also covers a socket directory with looser permissions
+  def _is_owner(self, connection):
+    if not hasattr(socket, "SO_PEERCRED"):
+      return True
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    pid, uid, gid = struct.unpack("3i", credentials)
+    return uid == os.getuid()
+  
+  # Writes a response line to a client
+  def _send(self, connection, response):
+    connection.sendall(json.dumps(response).encode(self._TEXT_ENCODING) + b"\n")
+  
+  # Executes a request line and returns the response
+  def _execute(self, line):
+    try:
+      request = json.loads(line.decode(self._TEXT_ENCODING))
+      if not isinstance(request, dict) or not "op" in request:
+        raise ValueError("A request must be an object with an op key.")
+      op = request["op"]
+      self._expire()
+      if op == "add":
+        vault_key = self._get_vault_key(request)
+        key = bytearray(self._decode(request, "key"))
+        verifier = self._get_verifier(key, self._require_string(request, "password"))
+        with self._lock:
+          # A vault has one key envelope at a time, so keys held for an older envelope of the same vault are stale
+          for held_key in [held_key for held_key in self._keys if held_key[0] == vault_key[0]]:
+            self._discard(held_key)
+          self._keys[vault_key] = {"key": key, "verifier": verifier, "expires": time.monotonic() + self._ttl}
+        return {"ok": True}
+      if op == "get":
+        with self._lock:
+          held = self._keys.get(self._get_vault_key(request))
+          if held == None:
+            return {"ok": False, "error": "The agent does not hold the key of this vault."}
+          if not hmac.compare_digest(held["verifier"], self._get_verifier(held["key"], self._require_string(request, "password"))):
+            return {"ok": False, "error": "The master password does not match."}
+          return {"ok": True, "key": base64.b64encode(held["key"]).decode(self._TEXT_ENCODING)}
+      if op == "forget":
+        path = os.path.abspath(self._require_string(request, "path"))
+        with self._lock:
+          forgotten = [vault_key for vault_key in self._keys if vault_key[0] == path]
+          for vault_key in forgotten:
+            self._discard(vault_key)
+        return {"ok": True, "forgotten": len(forgotten)}
+      if op == "lock":
+        return {"ok": True, "forgotten": self._forget()}
+      if op == "list":
+        now = time.monotonic()
+        with self._lock:
+          return {"ok": True, "vaults": [{"path": vault_key[0], "expires_in": round(held["expires"] - now, 1)} for vault_key, held in sorted(self._keys.items())]}
+      if op == "stop":
+        self.stop()
+        return {"ok": True, "forgotten": self._forget()}
+      raise ValueError("Unknown op: " + str(op) + ".")
+    except (ValueError, TypeError, KeyError) as e:
+      return {"ok": False, "error": str(e)}
+  
+  # Returns the string value of a request field
+  # Raises ValueError if the field is missing or not a string
+  def _require_string(self, request, name):
+    value = request.get(name)
+    if not isinstance(value, str):
+      raise ValueError("The " + name + " field must be a string.")
+    return value
+  
+  # Returns the bytes of a base64 request field
+  def _decode(self, request, name):
+    return base64.b64decode(self._require_string(request, name).encode(self._TEXT_ENCODING), validate=True)
+  
+  # Returns the key under which the data key of the vault named by a request is held: (absolute path, salt in base64)
+  def _get_vault_key(self, request):
+    return (os.path.abspath(self._require_string(request, "path")), base64.b64encode(self._decode(request, "salt")).decode(self._TEXT_ENCODING))
+  
+  # Returns the verifier of a master password for a data key
+  def _get_verifier(self, key, password):
+    return hmac.new(key, password.encode(self._TEXT_ENCODING), hashlib.sha256).digest()
+  
+  # Forgets the keys whose lifetime is over
+  def _expire(self):
+    now = time.monotonic()
+    with self._lock:
+      for vault_key in [vault_key for vault_key, held in self._keys.items() if held["expires"] <= now]:
+        self._discard(vault_key)
+  
+  # Forgets every key and returns how many were held
+  def _forget(self):
+    with self._lock:
+      count = len(self._keys)
+      for vault_key in list(self._keys):
+        self._discard(vault_key)
+      return count
+  
+  # Overwrites a held key with zeros and forgets it (if held)
+  # The caller must hold the agent lock
+  def _discard(self, vault_key):
+    held = self._keys.pop(vault_key, None)
+    if not held == None:
+      held["key"][:] = bytes(len(held["key"]))
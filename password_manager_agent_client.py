@@ -0,0 +1,103 @@
+import base64
+import json
+import os
+import socket
+
+# PasswordManagerAgentClient
+# Talks to the unlock agent (PasswordManagerAgent) on behalf of a PasswordManager or the runner
+
+# Class to request, store and forget unlocked data keys held by the unlock agent
+# The agent is optional: if it cannot be reached, get_key returns None and add_key does nothing, so the caller falls back to unlocking with the master password
+# Commands that manage the agent itself (forget, lock, list_vaults, stop) raise OSError if it cannot be reached and ValueError if it refuses the request
+class PasswordManagerAgentClient(object):
+  # Constants
+  _TEXT_ENCODING = "UTF-8"
+  _SOCKET_ENV_VARIABLE = "PASSWORD_MANAGER_AGENT_SOCK" # Environment variable holding the socket path of the running agent
+  _TIMEOUT = 2.0 # Seconds to wait for the agent to answer
+  
+  # Instance variables
+  _socket_path = None
+  
+  # Constructor
+  # socket_path is the path of the Unix socket of the agent
+  def __init__(self, socket_path):
+    self._socket_path = socket_path
+  
+  # Returns a client for the agent named by the PASSWORD_MANAGER_AGENT_SOCK environment variable (None if it is not set)
+  @classmethod
+  def from_environment(cls):
+    socket_path = os.environ.get(cls._SOCKET_ENV_VARIABLE)
+    if socket_path == None or len(socket_path) == 0:
+      return None
+    return cls(socket_path)
+  
+  # Returns the path of the socket of the agent
+  def get_socket_path(self):
+    return self._socket_path
+  
+  # Returns the unlocked data key of the vault at vault_path whose key envelope has the given salt, as a bytearray the caller should overwrite once done with it
+  # Returns None if the agent cannot be reached, does not hold the key or holds it for another master password
+  def get_key(self, vault_path, salt, master_password):
+    try:
+      response = self._request({"op": "get", "path": os.path.abspath(vault_path), "salt": self._encode(salt), "password": master_password})
+    except OSError:
+      return None
+    if not response.get("ok") or not isinstance(response.get("key"), str):
+      return None
+    return bytearray(base64.b64decode(response["key"].encode(self._TEXT_ENCODING)))
+  
+  # Gives the unlocked data key of the vault at vault_path (key envelope with the given salt) to the agent, to be returned to callers with the same master password
+  # Returns whether the agent stored the key
+  def add_key(self, vault_path, salt, key, master_password):
+    try:
+      response = self._request({"op": "add", "path": os.path.abspath(vault_path), "salt": self._encode(salt), "key": self._encode(key), "password": master_password})
+    except OSError:
+      return False
+    return response.get("ok") == True
+  
+  # Makes the agent forget the keys of the vault at vault_path and returns how many it held
+  def forget(self, vault_path):
+    return self._command({"op": "forget", "path": os.path.abspath(vault_path)})["forgotten"]
+  
+  # Makes the agent forget every key and returns how many it held
+  def lock(self):
+    return self._command({"op": "lock"})["forgotten"]
+  
+  # Returns the vaults whose keys the agent holds: a list of dictionaries with path and expires_in (seconds) keys
+  def list_vaults(self):
+    return self._command({"op": "list"})["vaults"]
+  
+  # Makes the agent forget every key and stop
+  def stop(self):
+    self._command({"op": "stop"})
+  
+  # Sends a request and returns the response, raising ValueError if the agent refused it
+  def _command(self, request):
+    response = self._request(request)
+    if not response.get("ok"):
+      raise ValueError(response.get("error", "The agent refused the request."))
+    return response
+  
+  # Sends one request to the agent and returns its response
+  # Raises OSError if the agent cannot be reached or does not answer
+  def _request(self, request):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      connection.settimeout(self._TIMEOUT)
+      connection.connect(self._socket_path)
+      connection.sendall(json.dumps(request).encode(self._TEXT_ENCODING) + b"\n")
+      reader = connection.makefile("rb")
+      try:
+        line = reader.readline()
+      finally:
+        reader.close()
+    finally:
+      connection.close()
+    try:
+      return json.loads(line.decode(self._TEXT_ENCODING))
+    except ValueError:
+      raise OSError("The agent did not answer.")
+  
+  # Returns bytes encoded in base64 as a string
+  def _encode(self, data):
+    return base64.b64encode(data).decode(self._TEXT_ENCODING)
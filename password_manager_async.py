@@ -0,0 +1,129 @@
+import asyncio
+import functools
+from password_manager import PasswordManager, _generate_password_chunk
+
+# AsyncPasswordManager
+# asyncio front end for PasswordManager that keeps key derivation, cryptography, password generation and vault file I/O off the event loop
+
+# Class to use a PasswordManager from coroutines
+# The vault is unlocked by await open(); until then no other coroutine may be used
+# Password generation runs on executor, which may be any concurrent.futures.Executor (including a process pool, since only the (length, site, phrase) request is sent to it); None uses the default executor of the event loop
+# Work that needs the unlocked vault itself (unlocking, loading, sealing/unsealing entries and saving) runs in threads on io_executor (None uses the default executor of the event loop)
+# All access to the vault goes through one asyncio lock, so coroutines never see a half-applied change or a vault that is being reloaded by a save
+# Changes are saved by one save task at a time; changes made while a save is running are written together by the next save, so many concurrent changes cost at most two writes
+class AsyncPasswordManager(object):
+  # Instance variables
+  _vault_path = None
+  _master_password = None
+  _options = None
+  _executor = None
+  _io_executor = None
+  _manager = None
+  _state_lock = None
+  _save_task = None
+  _change_count = 0 # Number of changes made so far
+  _saved_count = 0 # Number of changes written to the vault so far
+  
+  # Constructor
+  # vault_path, master_password, vault_format, entry_encryption and container_format are passed to PasswordManager by open()
+  def __init__(self, vault_path=None, master_password=None, vault_format="json", entry_encryption=False, container_format="json", executor=None, io_executor=None):
+    self._vault_path = vault_path
+    self._master_password = master_password
+    self._options = {"vault_format": vault_format, "entry_encryption": entry_encryption, "container_format": container_format}
+    self._executor = executor
+    self._io_executor = io_executor
+    self._manager = None
+    self._state_lock = None
+    self._save_task = None
+    self._change_count = 0
+    self._saved_count = 0
+  
+  # Unlocks and loads the vault (creating it if nonexistant) in a thread
+  # Raises the same errors as the PasswordManager constructor (ValueError for a wrong master password)
+  async def open(self):
+    if not self._manager == None:
+      return self
+    self._state_lock = asyncio.Lock()
+    manager = await self._run_in_thread(functools.partial(PasswordManager, self._vault_path, self._master_password, **self._options))
+    self._manager = manager
+    return self
+  
+  # Waits for every change made so far to be saved
+  async def close(self):
+    await self._wait_saved(self._change_count)
+  
+  async def __aenter__(self):
+    return await self.open()
+  
+  async def __aexit__(self, exc_type, exc_value, traceback):
+    await self.close()
+  
+  # Returns the unlocked PasswordManager (None before open())
+  def get_manager(self):
+    return self._manager
+  
+  # Returns the password stored for a site string (None if nonexistant)
+  async def get(self, site):
+    async with self._state_lock:
+      if self._manager.get_entry_encryption():
+        return await self._run_in_thread(self._manager.get_password, site)
+      return self._manager.get_password(site)
+  
+  # Generates and stores a password, returning once it is saved
+  # Takes the same arguments as PasswordManager.generate_password and likewise returns None for an invalid length, site or phrase
+  # Raises ValueError if the site or phrase contains invalid characters
+  async def generate(self, length, site, phrase):
+    if length < 1 or site == None or site == "" or phrase == None or phrase == "":
+      return None
+    results = await asyncio.get_running_loop().run_in_executor(self._executor, _generate_password_chunk, [(length, site, phrase)])
+    site, password, error = results[0]
+    if not error == None:
+      raise ValueError(error)
+    async with self._state_lock:
+      # The change is saved by the save task; sealing the password (with per-entry encryption) runs in a thread
+      if self._manager.get_entry_encryption():
+        await self._run_in_thread(self._manager.set_password, site, password, False)
+      else:
+        self._manager.set_password(site, password, False)
+      self._change_count += 1
+      change = self._change_count
+    await self._wait_saved(change)
+    return password
+  
+  # Deletes the password for a site string, returning once the deletion is saved
+  # Returns whether a password was deleted
+  async def delete(self, site):
+    async with self._state_lock:
+      if not self._manager.delete_password(site, False):
+        return False
+      self._change_count += 1
+      change = self._change_count
+    await self._wait_saved(change)
+    return True
+  
+  # Returns the list of entries (dictionaries with site and password keys)
+  async def list(self):
+    async with self._state_lock:
+      return await self._run_in_thread(self._manager.get_passwords)
+  
+  # Runs function(*args) in a thread on io_executor and returns its result
+  async def _run_in_thread(self, function, *args):
+    return await asyncio.get_running_loop().run_in_executor(self._io_executor, functools.partial(function, *args))
+  
+  # Waits until the change numbered change has been written, starting a save task if none is running
+  # If the save fails, its error is raised to every caller waiting for it; the changes stay pending and are retried by the next save
+  async def _wait_saved(self, change):
+    while self._saved_count < change:
+      if self._save_task == None:
+        self._save_task = asyncio.ensure_future(self._save())
+      await asyncio.shield(self._save_task)
+  
+  # Writes every change made so far with a single save of the vault
+  async def _save(self):
+    try:
+      async with self._state_lock:
+        change = self._change_count
+        await self._run_in_thread(self._manager.save)
+        self._saved_count = change
+    finally:
+      self._save_task = None
@@ -0,0 +1,149 @@
+import hashlib
+import math
+import os
+import time
+from password_generator import PasswordGenerator
+from password_manager_stats import PasswordManagerStats
+
+# PasswordManagerAudit
+# Checks every password of a vault for reuse, short length and a weak mix of character types in a single pass
+
+# Class to audit the entries of an unlocked PasswordManager
+# Reuse is found with a keyed hash index: each password is hashed with BLAKE2b under a random key made for the audit, and entries whose hashes collide share a password, so no pairwise comparison is made and no password (or unkeyed hash of one) appears in the report
+# Characters are classified like PasswordGenerator.get_char_type (lowercase, uppercase, numbers, symbols) through a translation table, and the set of characters of the translated password gives the types present without a Python loop over the characters
+# Entropy is estimated as length * log2(pool), where pool is the total size of the character types present in the password (characters outside the four types add _OTHER_POOL_SIZE); it is an upper bound that assumes random characters
+class PasswordManagerAudit(object):
+  # Constants
+  _TEXT_ENCODING = "UTF-8"
+  _MIN_CHAR_TYPES = 3 # Passwords using fewer character types are flagged as a weak mix
+  _HASH_SIZE = 16 # Bytes of the keyed hash of a password
+  _OTHER_POOL_SIZE = 32 # Pool size added by characters outside the four character types
+  _TYPE_MARKERS = "aA0!" # Character that each character type is translated to, in the order of PasswordGenerator._CHAR_TYPE_NAMES
+  _TRANSLATION = str.maketrans("".join(PasswordGenerator._CHAR_TYPE_CHARS), "".join([marker * len(chars) for marker, chars in zip(_TYPE_MARKERS, PasswordGenerator._CHAR_TYPE_CHARS)]))
+  _POOL_SIZES = [len(set(chars)) for chars in PasswordGenerator._CHAR_TYPE_CHARS]
+  
+  # Instance variables
+  _manager = None
+  _min_length = 0
+  
+  # Constructor
+  # manager is the unlocked PasswordManager to audit
+  # min_length is the length below which a password is flagged as short (the CLI and runner pass PasswordManagerCLI._MIN_RECOMMENDED_LENGTH)
+  def __init__(self, manager, min_length):
+    self._manager = manager
+    self._min_length = min_length
+  
+  # Audits every entry of the vault and returns the report as a dictionary (JSON-serializable):
+  # entries - number of entries audited
+  # reused - groups of sites sharing a password (largest first, each a sorted list of sites) and the number of entries in them
+  # short - sites whose password is shorter than min_length
+  # weak_mix - sites whose password uses fewer than _MIN_CHAR_TYPES character types
+  # entropy - minimum, mean and maximum estimated entropy in bits
+  # char_types - number of passwords using each character type
+  # details (only if details is true) - per entry: site, length, entropy, count of each character type and flags
+  # seconds - time taken
+  def run(self, details=False):
+    start = PasswordManagerStats.start()
+    started = time.perf_counter()
+    hash_key = os.urandom(32)
+    blake2b = hashlib.blake2b
+    translation = self._TRANSLATION
+    markers = self._TYPE_MARKERS
+    min_length = self._min_length
+    log_pool_sizes = self._get_log_pool_sizes()
+    type_masks = self._get_type_masks()
+    type_counts = [bin(mask).count("1") for mask in range(16)] # Number of character types in each mask
+    mask_counts = [0] * 32
+    first_sites = {} # Keyed hash -> first site with that password
+    reused_groups = {} # Keyed hash -> sites sharing that password (only for reused passwords)
+    short_sites = []
+    weak_sites = []
+    entropy_total = 0.0
+    entropy_min = None
+    entropy_max = None
+    entry_details = [] if details else None
+    count = 0
+    for entry in self._manager.iter_passwords():
+      site = entry.site
+      password = entry.password
+      digest = blake2b(password.encode(self._TEXT_ENCODING), digest_size=self._HASH_SIZE, key=hash_key).digest()
+      first_site = first_sites.setdefault(digest, site)
+      if not first_site is site:
+        group = reused_groups.get(digest)
+        if group == None:
+          reused_groups[digest] = [first_site, site]
+        else:
+          group.append(site)
+      # The set of characters of the translated password is the set of character types present, looked up in a table of the 16 possible sets
+      mask = type_masks.get(frozenset(password.translate(translation)))
+      if mask == None:
+        mask = self._get_type_mask(password.translate(translation))
+      mask_counts[mask] += 1
+      entropy = len(password) * log_pool_sizes[mask]
+      entropy_total += entropy
+      if entropy_min == None or entropy < entropy_min:
+        entropy_min = entropy
+      if entropy_max == None or entropy > entropy_max:
+        entropy_max = entropy
+      short = len(password) < min_length
+      if short:
+        short_sites.append(site)
+      weak_mix = type_counts[mask & 15] < self._MIN_CHAR_TYPES
+      if weak_mix:
+        weak_sites.append(site)
+      if details:
+        classified = password.translate(translation)
+        flags = [flag for flag, flagged in (("short", short), ("weak_mix", weak_mix)) if flagged]
+        entry_details.append({"site": site, "length": len(password), "entropy": round(entropy, 1), "char_types": dict([(name, classified.count(marker)) for name, marker in zip(PasswordGenerator._CHAR_TYPE_NAMES, markers)]), "flags": flags})
+      count += 1
+    groups = sorted([sorted(group) for group in reused_groups.values()], key = lambda group: (-len(group), group[0]))
+    if details:
+      # Reuse is only known once every entry has been seen
+      reused_sites = set([site for group in groups for site in group])
+      for entry_detail in entry_details:
+        if entry_detail["site"] in reused_sites:
+          entry_detail["flags"].insert(0, "reused")
+    report = {}
+    report["entries"] = count
+    report["reused"] = {"groups": groups, "entries": sum([len(group) for group in groups])}
+    report["short"] = short_sites
+    report["weak_mix"] = weak_sites
+    report["min_length"] = self._min_length
+    report["entropy"] = {"min": round(entropy_min or 0.0, 1), "mean": round(entropy_total / count, 1) if count > 0 else 0.0, "max": round(entropy_max or 0.0, 1)}
+    report["char_types"] = dict([(PasswordGenerator._CHAR_TYPE_NAMES[i], sum([mask_counts[mask] for mask in range(32) if mask & (1 << i)])) for i in range(4)])
+    if details:
+      report["details"] = entry_details
+    report["seconds"] = time.perf_counter() - started
+    PasswordManagerStats.stop("audit.run", start, count)
+    return report
+  
+  # Returns the mask of the character types present in a translated password: bits 0 to 3 for the four types (in the order of PasswordGenerator._CHAR_TYPE_NAMES), bit 4 for other characters
+  def _get_type_mask(self, classified):
+    mask = 0
+    for char in set(classified):
+      position = self._TYPE_MARKERS.find(char)
+      if position == -1:
+        mask |= 16
+      else:
+        mask |= 1 << position
+    return mask
+  
+  # Returns the mask of each set of type markers without other characters (frozenset of markers -> mask)
+  def _get_type_masks(self):
+    type_masks = {}
+    for mask in range(16):
+      type_masks[frozenset([self._TYPE_MARKERS[i] for i in range(4) if mask & (1 << i)])] = mask
+    return type_masks
+  
+  # Returns log2 of the pool size for each mask of character types present (bits 0 to 3 for the four types, bit 4 for other characters)
+  def _get_log_pool_sizes(self):
+    log_pool_sizes = []
+    for mask in range(32):
+      pool = 0
+      for i in range(4):
+        if mask & (1 << i):
+          pool += self._POOL_SIZES[i]
+      if mask & 16:
+        pool += self._OTHER_POOL_SIZE
+      log_pool_sizes.append(math.log2(pool) if pool > 1 else 0.0)
+    return log_pool_sizes
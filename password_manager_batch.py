@@ -0,0 +1,101 @@
+import json
+
+# PasswordManagerBatch
+# Executes scripted commands (dictionaries, usually read as JSON lines) against one unlocked PasswordManager
+
+# Class to run commands against a PasswordManager without prompting
+# Supported commands (the "op" key selects the command; an optional "id" key is copied into the result):
+# {"op": "get", "site": ...} - returns the password for a site
+# {"op": "generate", "length": ..., "site": ..., "phrase": ...} - generates and stores a password ("set" is an alias)
+# {"op": "delete", "site": ...} - deletes the password for a site
+# {"op": "list"} - returns every entry
+# Every result is a dictionary with an "ok" key, plus "error" on failure
+class PasswordManagerBatch(object):
+  # Instance variables
+  _manager = None
+  _failures = 0
+  
+  # Constructor
+  # manager is the unlocked PasswordManager to run commands against
+  def __init__(self, manager):
+    self._manager = manager
+    self._failures = 0
+  
+  # Returns the number of commands that failed so far
+  def get_failures(self):
+    return self._failures
+  
+  # Executes one command and returns its result
+  def execute(self, command):
+    result = {"ok": True}
+    if isinstance(command, dict) and "id" in command:
+      result["id"] = command["id"]
+    try:
+      if not isinstance(command, dict) or not "op" in command:
+        raise ValueError("A command must be an object with an op key.")
+      op = command["op"]
+      result["op"] = op
+      if op == "get":
+        site = self._require_string(command, "site")
+        if not self._manager.password_exists(site):
+          raise ValueError("There is no password associated with that site.")
+        result["site"] = site
+        result["password"] = self._manager.get_password(site)
+      elif op == "generate" or op == "set":
+        site = self._require_string(command, "site")
+        phrase = self._require_string(command, "phrase")
+        length = command.get("length")
+        if not isinstance(length, int) or isinstance(length, bool) or length < 1:
+          raise ValueError("length must be an integer of at least 1.")
+        result["site"] = site
+        result["replaced"] = self._manager.password_exists(site)
+        result["password"] = self._manager.generate_password(length, site, phrase)
+      elif op == "delete":
+        site = self._require_string(command, "site")
+        if not self._manager.password_exists(site):
+          raise ValueError("There is no password associated with that site.")
+        self._manager.delete_password(site)
+        result["site"] = site
+      elif op == "list":
+        result["entries"] = [dict(entry) for entry in self._manager.iter_passwords()]
+      else:
+        raise ValueError("Unknown op: " + str(op) + ".")
+    except ValueError as e:
+      self._failures += 1
+      result["ok"] = False
+      result["error"] = str(e)
+    return result
+  
+  # Returns command[key] if it is a nonempty string of valid characters (raises ValueError otherwise)
+  def _require_string(self, command, key):
+    value = command.get(key)
+    if not isinstance(value, str) or len(value) == 0 or not self._manager.is_valid_string(value):
+      raise ValueError(key + " must be a nonempty string of lowercase letters, uppercase letters, numbers, and special keyboard characters.")
+    return value
+  
+  # Executes newline-delimited JSON commands read from lines (an iterable of strings, such as a file) and writes one JSON result line per command to output
+  # All changes are written to the vault with a single save at the end, followed by a final {"op": "commit"} result line
+  # Returns the number of failed commands (including a failed commit)
+  def run(self, lines, output):
+    commit = {"op": "commit", "ok": True}
+    try:
+      with self._manager.batch():
+        for line in lines:
+          if len(line.strip()) == 0:
+            continue
+          try:
+            command = json.loads(line)
+          except ValueError:
+            self._failures += 1
+            result = {"ok": False, "error": "Invalid JSON."}
+          else:
+            result = self.execute(command)
+          output.write(json.dumps(result) + "\n")
+          output.flush()
+    except (OSError, ValueError) as e:
+      self._failures += 1
+      commit["ok"] = False
+      commit["error"] = str(e)
+    output.write(json.dumps(commit) + "\n")
+    output.flush()
+    return self._failures
@@ -0,0 +1,274 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from password_generator import PasswordGenerator
+from password_manager import PasswordManager
+from password_manager_crypto import PasswordManagerCrypto
+from password_manager_entry import PasswordManagerEntry
+
+# PasswordManagerBenchmark
+# Benchmarks the password generator, the vault cryptography, vault I/O and the memory used by vault entries
+# Run this file directly (see --help); results can be saved as JSON and compared against a saved baseline
+
+# Class that runs the benchmarks and collects their results
+# Each result records the best wall time of the repeats, the throughput derived from it and the peak traced memory of one extra run
+class PasswordManagerBenchmark(object):
+  # Constants
+  _MASTER_PASSWORD = "benchmark-master-password"
+  _LOOKUP_COUNT = 10000 # Maximum number of lookups timed per vault size
+  _DELETE_COUNT = 1000 # Maximum number of deletions timed per vault size
+  _SYNTHETIC_PASSWORD_LENGTH = 16
+  _STARTUP_MODULE = "password_manager_runner" # Module whose import time is checked against the startup budget
+  _STARTUP_BUDGET_MS = 25.0 # Maximum import time of _STARTUP_MODULE in milliseconds
+  _UNLOCK_MODULES = ("password_manager_runner", "password_manager", "password_manager_batch", "password_manager_crypto") # Modules imported by a scripted get
+  
+  # Instance variables
+  _repeat = 3
+  _trace_memory = True
+  _results = None
+  
+  # Constructor
+  # repeat is the number of timed runs per benchmark (the best is reported)
+  # trace_memory enables the extra tracemalloc run that measures peak memory
+  def __init__(self, repeat=3, trace_memory=True):
+    self._repeat = max(1, repeat)
+    self._trace_memory = trace_memory
+    self._results = {}
+  
+  # Returns the collected results (benchmark name -> result dictionary)
+  def get_results(self):
+    return self._results
+  
+  # Times run() and records the result under name
+  # setup (optional) is called before every run and its return value passed to run; it is not timed
+  # units is the amount of work done by one run (for example bytes or entries), reported as throughput in unit per second
+  def measure(self, name, run, units, unit, setup=None):
+    best = None
+    for i in range(self._repeat):
+      argument = setup() if not setup == None else None
+      start = time.perf_counter()
+      run(argument)
+      elapsed = time.perf_counter() - start
+      if best == None or elapsed < best:
+        best = elapsed
+    peak = None
+    if self._trace_memory:
+      argument = setup() if not setup == None else None
+      tracemalloc.start()
+      run(argument)
+      peak = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+    result = {"seconds": best, "throughput": units / best if best > 0 else None, "unit": unit, "peak_bytes": peak}
+    self._results[name] = result
+    print(self.format_result(name, result))
+    sys.stdout.flush()
+  
+  # Records a result measured outside measure() and prints it
+  def record(self, name, result):
+    self._results[name] = result
+    print(self.format_result(name, result))
+    sys.stdout.flush()
+  
+  # Returns a one-line description of a result
+  def format_result(self, name, result):
+    line = name.ljust(40) + ("%.6f s" % result["seconds"]).rjust(14)
+    if not result["throughput"] == None:
+      line += ("%.1f %s/s" % (result["throughput"], result["unit"])).rjust(26)
+    if not result["peak_bytes"] == None:
+      line += ("%.1f KiB peak" % (result["peak_bytes"] / 1024.0)).rjust(20)
+    if "bytes_per_entry" in result:
+      line += ("%.1f bytes/entry" % result["bytes_per_entry"]).rjust(22)
+    return line
+  
+  # Benchmarks PasswordGenerator.make_password for each password length
+  def bench_generator(self, lengths):
+    generator = PasswordGenerator(random.Random(0))
+    for length in lengths:
+      self.measure("generator.make_password[" + str(length) + "]", lambda argument: generator.make_password(length, "example.com", "benchmark-phrase"), length, "chars")
+  
+  # Benchmarks key generation, key unlocking, encryption and decryption for each payload size
+  def bench_crypto(self, payload_sizes):
+    crypto = PasswordManagerCrypto()
+    self.measure("crypto.generate_key", lambda argument: crypto.generate_key(self._MASTER_PASSWORD), 1, "keys")
+    key_details = crypto.generate_key(self._MASTER_PASSWORD)
+    self.measure("crypto.unlock_key", lambda argument: crypto.unlock_key(self._MASTER_PASSWORD, key_details["enc_key"], key_details["salt"]), 1, "keys")
+    for size in payload_sizes:
+      payload = os.urandom(size)
+      encrypted = crypto.encrypt(payload)
+      self.measure("crypto.encrypt[" + str(size) + "]", lambda argument: crypto.encrypt(payload), size, "bytes")
+      self.measure("crypto.decrypt[" + str(size) + "]", lambda argument: crypto.decrypt(encrypted), size, "bytes")
+  
+  # Creates a vault file at path holding entry_count synthetic entries and returns the manager that wrote it
+  def make_vault(self, path, entry_count, container_format):
+    rng = random.Random(entry_count)
+    chars = PasswordGenerator._PHRASE_CHARS
+    manager = PasswordManager(path, self._MASTER_PASSWORD, container_format=container_format)
+    with manager.batch():
+      for i in range(entry_count):
+        password = "".join([chars[rng.randint(0, len(chars) - 1)] for j in range(self._SYNTHETIC_PASSWORD_LENGTH)])
+        manager.set_password("site" + str(i).zfill(7) + ".example.com", password)
+    return manager
+  
+  # Benchmarks loading, saving, looking up and deleting entries on synthetic vaults of each size
+  def bench_vault(self, sizes, container_formats):
+    with tempfile.TemporaryDirectory() as directory:
+      for container_format in container_formats:
+        for size in sizes:
+          path = os.path.join(directory, "vault-" + container_format + "-" + str(size))
+          manager = self.make_vault(path, size, container_format)
+          label = "[" + container_format + "," + str(size) + "]"
+          sites = [entry["site"] for entry in manager.get_passwords()]
+          rng = random.Random(size)
+          lookup_sites = [sites[rng.randint(0, len(sites) - 1)] for i in range(min(size, self._LOOKUP_COUNT))]
+          delete_sites = rng.sample(sites, min(size, self._DELETE_COUNT))
+          self.measure("vault.load" + label, lambda argument: PasswordManager(path, self._MASTER_PASSWORD), size, "entries")
+          self.measure("vault.save" + label, lambda argument: manager.save(), size, "entries")
+          self.measure("vault.lookup" + label, lambda argument: [manager.get_password(site) for site in lookup_sites], len(lookup_sites), "lookups")
+          self.measure("vault.delete" + label, lambda argument: self._delete_sites(argument, delete_sites), len(delete_sites), "deletes", setup=lambda: PasswordManager(path, self._MASTER_PASSWORD))
+          manager.save()
+  
+  # Measures the memory held by the entries of vaults of each size, both as the dictionaries the vault JSON decodes to (the representation used before PasswordManagerEntry) and as PasswordManagerEntry instances
+  # The memory of a whole unlocked vault (entries, site index and sorted sites) is measured as well
+  # Results record the traced bytes still allocated after building (peak_bytes) and the bytes per entry; the strings of the entries are included
+  def bench_memory(self, sizes):
+    with tempfile.TemporaryDirectory() as directory:
+      for size in sizes:
+        rng = random.Random(size)
+        chars = PasswordGenerator._PHRASE_CHARS
+        passwords = ["".join([chars[rng.randint(0, len(chars) - 1)] for j in range(self._SYNTHETIC_PASSWORD_LENGTH)]) for i in range(size)]
+        entries_json = json.dumps([{"site": "site" + str(i).zfill(7) + ".example.com", "password": passwords[i]} for i in range(size)])
+        del passwords
+        label = "[" + str(size) + "]"
+        self._measure_memory("memory.entries[dict]" + label, lambda: json.loads(entries_json), size)
+        self._measure_memory("memory.entries[slots]" + label, lambda: PasswordManagerEntry.loads(entries_json), size)
+        path = os.path.join(directory, "vault-" + str(size))
+        self.make_vault(path, size, "binary").close()
+        self._measure_memory("memory.vault" + label, lambda: PasswordManager(path, self._MASTER_PASSWORD), size)
+  
+  # Records the time taken by build() and the traced memory still held by the object it returns, per entry
+  def _measure_memory(self, name, build, entry_count):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    built = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del built
+    self.record(name, {"seconds": elapsed, "throughput": entry_count / elapsed if elapsed > 0 else None, "unit": "entries", "peak_bytes": held, "bytes_per_entry": held / float(entry_count)})
+  
+  # Deletes the given sites from manager in one batch
+  def _delete_sites(self, manager, sites):
+    with manager.batch():
+      for site in sites:
+        manager.delete_password(site)
+  
+  # Measures the cold-start import time of the modules with python -X importtime, each run in a fresh interpreter
+  # The first run is not counted so that it can write the bytecode caches
+  # Returns the best total import time of the modules in seconds
+  def measure_import(self, name, modules):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for i in range(self._repeat + 1):
+      completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)], cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+      microseconds = 0
+      for line in completed.stderr.splitlines():
+        columns = line.split("|")
+        if len(columns) == 3 and columns[2].strip() in modules and not columns[2].startswith("  "):
+          microseconds += int(columns[1].strip())
+      if i > 0 and (best == None or microseconds < best):
+        best = microseconds
+    self.record(name, {"seconds": best / 1000000.0, "throughput": None, "unit": "imports", "peak_bytes": None})
+    return best / 1000000.0
+  
+  # Benchmarks the startup cost of the runner and of the modules a scripted command needs to unlock a vault
+  # Returns True if importing the runner stays within budget_ms milliseconds
+  def bench_startup(self, budget_ms):
+    startup = self.measure_import("startup.import[runner]", (self._STARTUP_MODULE,))
+    self.measure_import("startup.import[unlock]", self._UNLOCK_MODULES)
+    if startup * 1000 > budget_ms:
+      print("Importing " + self._STARTUP_MODULE + " took " + ("%.1f" % (startup * 1000)) + " ms, over the startup budget of " + str(budget_ms) + " ms.")
+      return False
+    return True
+  
+  # Writes the results and details about this machine as JSON to path
+  def write_results(self, path):
+    report = {"python": platform.python_version(), "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": self._results}
+    results_handle = open(path, "w")
+    results_handle.write(json.dumps(report, indent=2, sort_keys=True))
+    results_handle.close()
+  
+  # Compares the results against a baseline results file written by write_results
+  # A benchmark regresses if its time exceeds the baseline time by more than tolerance (a fraction, 0.25 = 25% slower)
+  # Returns the list of names of regressed benchmarks
+  def compare(self, baseline_path, tolerance):
+    baseline_handle = open(baseline_path, "r")
+    baseline = json.loads(baseline_handle.read())["results"]
+    baseline_handle.close()
+    regressions = []
+    print()
+    print("Comparison with " + baseline_path + ":")
+    for name in sorted(self._results):
+      if not name in baseline or not baseline[name]["seconds"]:
+        continue
+      ratio = self._results[name]["seconds"] / baseline[name]["seconds"]
+      status = "ok"
+      if ratio > 1 + tolerance:
+        status = "REGRESSION"
+        regressions.append(name)
+      print(name.ljust(40) + ("%.2fx" % ratio).rjust(10) + "  " + status)
+    return regressions
+
+# Parses a comma-separated list of integers
+def _int_list(value):
+  return [int(item) for item in value.split(",") if len(item) > 0]
+
+# Parses the command line, runs the selected benchmarks and returns the exit status (1 if a regression was found)
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark the password generator, vault cryptography and vault I/O.")
+  parser.add_argument("--groups", default="startup,generator,crypto,vault", help="comma-separated benchmark groups to run (startup, generator, crypto, vault, memory)")
+  parser.add_argument("--lengths", type=_int_list, default=[16, 256, 4096, 65536], help="password lengths for make_password")
+  parser.add_argument("--payloads", type=_int_list, default=[1024, 65536, 1048576, 16777216], help="payload sizes in bytes for encrypt/decrypt")
+  parser.add_argument("--sizes", type=_int_list, default=[10, 1000, 100000], help="synthetic vault sizes in entries (up to 1000000)")
+  parser.add_argument("--memory-sizes", type=_int_list, default=[100000, 1000000], help="vault sizes in entries for the memory benchmarks")
+  parser.add_argument("--containers", default="json,binary", help="comma-separated vault containers to benchmark")
+  parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark; the best is reported")
+  parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run that measures peak memory")
+  parser.add_argument("--startup-budget", type=float, default=PasswordManagerBenchmark._STARTUP_BUDGET_MS, help="maximum import time of the runner in milliseconds (default " + ("%g" % PasswordManagerBenchmark._STARTUP_BUDGET_MS) + ")")
+  parser.add_argument("--output", help="write the results as JSON to this path")
+  parser.add_argument("--baseline", help="compare against a results file and fail on regressions")
+  parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline as a fraction (default 0.25)")
+  args = parser.parse_args(argv)
+  groups = args.groups.split(",")
+  benchmark = PasswordManagerBenchmark(args.repeat, not args.no_memory)
+  status = 0
+  if "startup" in groups and not benchmark.bench_startup(args.startup_budget):
+    status = 1
+  if "generator" in groups:
+    benchmark.bench_generator(args.lengths)
+  if "crypto" in groups:
+    benchmark.bench_crypto(args.payloads)
+  if "vault" in groups:
+    benchmark.bench_vault(args.sizes, args.containers.split(","))
+  if "memory" in groups:
+    benchmark.bench_memory(args.memory_sizes)
+  if not args.output == None:
+    benchmark.write_results(args.output)
+  if not args.baseline == None:
+    regressions = benchmark.compare(args.baseline, args.tolerance)
+    if len(regressions) > 0:
+      print(str(len(regressions)) + " benchmark(s) regressed.")
+      status = 1
+  return status
+
+if __name__ == "__main__":
+  sys.exit(main())
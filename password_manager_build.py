@@ -0,0 +1,63 @@
+import argparse
+import glob
+import os
+import py_compile
+import sys
+import tempfile
+import zipapp
+
+# PasswordManagerBuild
+# Builds the password manager into a single-file zipapp (run it with python password_manager.pyz, same arguments as password_manager_runner.py)
+
+# Class to build the zipapp
+# Every module is stored as source together with bytecode compiled by the building interpreter
+# The bytecode is hash-based and unchecked, so the same Python version loads it without compiling or checking the source; other versions fall back to the source
+# The pycryptodomex package is not bundled and must be installed where the zipapp runs
+class PasswordManagerBuild(object):
+  # Constants
+  _SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+  _MODULE_PATTERNS = ("password_generator.py", "password_manager*.py")
+  _EXCLUDED_MODULES = ("password_manager_build.py", "password_manager_benchmark.py")
+  _MAIN_SOURCE = "import sys\nfrom password_manager_runner import main\nsys.exit(main())\n"
+  _INTERPRETER = "/usr/bin/env python3"
+  
+  # Returns the paths of the modules to include
+  def get_modules(self):
+    modules = []
+    for pattern in self._MODULE_PATTERNS:
+      for path in sorted(glob.glob(os.path.join(self._SOURCE_DIRECTORY, pattern))):
+        if not os.path.basename(path) in self._EXCLUDED_MODULES and not path in modules:
+          modules.append(path)
+    return modules
+  
+  # Builds the zipapp at target and returns the list of included module names
+  def build(self, target):
+    names = []
+    with tempfile.TemporaryDirectory() as staging:
+      for path in self.get_modules():
+        name = os.path.basename(path)
+        source_handle = open(path, "rb")
+        source = source_handle.read()
+        source_handle.close()
+        staged_handle = open(os.path.join(staging, name), "wb")
+        staged_handle.write(source)
+        staged_handle.close()
+        py_compile.compile(os.path.join(staging, name), cfile=os.path.join(staging, name + "c"), dfile=name, doraise=True, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+        names.append(name[:-3])
+      main_handle = open(os.path.join(staging, "__main__.py"), "w")
+      main_handle.write(self._MAIN_SOURCE)
+      main_handle.close()
+      zipapp.create_archive(staging, target, interpreter=self._INTERPRETER, compressed=True)
+    return names
+
+# Parses the command line and builds the zipapp
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Build the password manager into a single-file zipapp with precompiled bytecode.")
+  parser.add_argument("--output", default="password_manager.pyz", help="path of the zipapp to write (default: password_manager.pyz)")
+  args = parser.parse_args(argv)
+  names = PasswordManagerBuild().build(args.output)
+  print("Wrote " + args.output + " (" + ", ".join(names) + ") for Python " + ".".join([str(part) for part in sys.version_info[:2]]) + ".")
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,210 @@
+import base64
+import contextlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from password_manager_stats import PasswordManagerStats
+
+# PasswordManagerContainer
+# Reads and writes the vault file in either of its two container formats
+
+# Class to read and write vault files
+# A vault is represented as a dictionary of fields: enc_key, salt and enc_passwords hold bytes, every other field is metadata (JSON value)
+# Two containers are supported:
+# json - a JSON object with the byte fields encoded in base64 (the original format)
+# binary - a fixed header followed by length-prefixed sections holding the byte fields raw and the metadata as JSON
+class PasswordManagerContainer(object):
+  # Constants
+  _TEXT_ENCODING = "UTF-8"
+  _CONTAINERS = ("json", "binary")
+  _BYTE_FIELDS = ("enc_key", "salt", "enc_passwords")
+  _MAGIC = b"PMVAULT\x00"
+  _VERSION = 1
+  _HEADER = struct.Struct(">8sHH") # Magic, version, section count
+  _SECTION_HEADER = struct.Struct(">BQ") # Section name length, section data length
+  _META_SECTION = "meta"
+  
+  # Returns the container format of the vault file at path ("json" or "binary")
+  def detect(self, path):
+    vault_handle = open(path, "rb")
+    magic = vault_handle.read(len(self._MAGIC))
+    vault_handle.close()
+    if magic == self._MAGIC:
+      return "binary"
+    return "json"
+  
+  # Context manager that reads the vault file at path and yields (container, fields, size)
+  # For binary containers the byte fields are memoryview slices of a memory-mapped file, so they are only valid inside the with block
+  @contextlib.contextmanager
+  def read(self, path):
+    if self.detect(path) == "binary":
+      start = PasswordManagerStats.start()
+      vault_handle = open(path, "rb")
+      try:
+        vault_map = mmap.mmap(vault_handle.fileno(), 0, access=mmap.ACCESS_READ)
+      finally:
+        vault_handle.close()
+      PasswordManagerStats.stop("vault.file_map", start, len(vault_map))
+      vault_view = memoryview(vault_map)
+      fields = {}
+      try:
+        fields = self._parse_binary(vault_view)
+        yield ("binary", fields, len(vault_map))
+      finally:
+        for name in self._BYTE_FIELDS:
+          if isinstance(fields.get(name), memoryview):
+            fields[name].release()
+        vault_view.release()
+        vault_map.close()
+    else:
+      start = PasswordManagerStats.start()
+      vault_handle = open(path, "r")
+      vault_file_contents = vault_handle.read()
+      vault_handle.close()
+      PasswordManagerStats.stop("vault.file_read", start, len(vault_file_contents))
+      start = PasswordManagerStats.start()
+      fields = json.loads(vault_file_contents)
+      PasswordManagerStats.stop("vault.json_parse", start, len(vault_file_contents))
+      start = PasswordManagerStats.start()
+      for name in self._BYTE_FIELDS:
+        fields[name] = base64.b64decode(fields[name].encode(self._TEXT_ENCODING))
+      PasswordManagerStats.stop("vault.base64_decode", start, len(fields["enc_passwords"]))
+      yield ("json", fields, len(vault_file_contents))
+  
+  # Parses the sections of a binary container (view is a memoryview of the whole file)
+  def _parse_binary(self, view):
+    if len(view) < self._HEADER.size:
+      raise ValueError("The vault file is truncated.")
+    magic, version, section_count = self._HEADER.unpack_from(view, 0)
+    if not magic == self._MAGIC or version > self._VERSION:
+      raise ValueError("Unsupported vault file version.")
+    offset = self._HEADER.size
+    fields = {}
+    for i in range(section_count):
+      if offset + self._SECTION_HEADER.size > len(view):
+        raise ValueError("The vault file is truncated.")
+      name_length, data_length = self._SECTION_HEADER.unpack_from(view, offset)
+      offset += self._SECTION_HEADER.size
+      name = bytes(view[offset:offset + name_length]).decode(self._TEXT_ENCODING)
+      offset += name_length
+      if offset + data_length > len(view):
+        raise ValueError("The vault file is truncated.")
+      data = view[offset:offset + data_length]
+      offset += data_length
+      if name == self._META_SECTION:
+        fields.update(json.loads(bytes(data).decode(self._TEXT_ENCODING)))
+        data.release()
+      else:
+        fields[name] = data
+    return fields
+  
+  # Writes the vault fields to path using the given container ("json" or "binary")
+  # The file is replaced atomically: the contents are written and synced to a temporary file in the same directory, which is then renamed over path
+  # Returns the number of bytes written
+  def write(self, path, fields, container):
+    if not container in self._CONTAINERS:
+      raise ValueError("Container must be one of: " + ", ".join(self._CONTAINERS) + ".")
+    if container == "binary":
+      return self.write_atomic(path, self._make_binary_chunks(fields, [fields["enc_passwords"]], len(fields["enc_passwords"])))
+    start = PasswordManagerStats.start()
+    vault_contents = {}
+    for name in fields:
+      if name in self._BYTE_FIELDS:
+        vault_contents[name] = base64.b64encode(fields[name]).decode(self._TEXT_ENCODING)
+      else:
+        vault_contents[name] = fields[name]
+    PasswordManagerStats.stop("vault.base64_encode", start, len(fields["enc_passwords"]))
+    start = PasswordManagerStats.start()
+    vault_file_contents = json.dumps(vault_contents)
+    PasswordManagerStats.stop("vault.json_serialize", start, len(vault_file_contents))
+    return self.write_atomic(path, [vault_file_contents.encode(self._TEXT_ENCODING)])
+  
+  # Writes the vault fields like write(), except that enc_passwords is given separately as an iterable of byte chunks totalling enc_passwords_length bytes
+  # The chunks are written as they are produced, so the encrypted passwords are never held in memory at once
+  # Returns the number of bytes written
+  def write_streamed(self, path, fields, enc_passwords_chunks, enc_passwords_length, container):
+    if not container in self._CONTAINERS:
+      raise ValueError("Container must be one of: " + ", ".join(self._CONTAINERS) + ".")
+    if container == "binary":
+      return self.write_atomic(path, self._make_binary_chunks(fields, enc_passwords_chunks, enc_passwords_length))
+    return self.write_atomic(path, self._make_json_chunks(fields, enc_passwords_chunks))
+  
+  # Yields the pieces of a binary container holding fields, with enc_passwords taken from enc_passwords_chunks
+  def _make_binary_chunks(self, fields, enc_passwords_chunks, enc_passwords_length):
+    meta = {}
+    for name in fields:
+      if not name in self._BYTE_FIELDS:
+        meta[name] = fields[name]
+    sections = [(self._META_SECTION, json.dumps(meta).encode(self._TEXT_ENCODING)), ("enc_key", fields["enc_key"]), ("salt", fields["salt"])]
+    yield self._HEADER.pack(self._MAGIC, self._VERSION, len(sections) + 1)
+    for name, data in sections:
+      name_bytes = name.encode(self._TEXT_ENCODING)
+      yield self._SECTION_HEADER.pack(len(name_bytes), len(data))
+      yield name_bytes
+      yield data
+    name_bytes = "enc_passwords".encode(self._TEXT_ENCODING)
+    yield self._SECTION_HEADER.pack(len(name_bytes), enc_passwords_length)
+    yield name_bytes
+    written = 0
+    for chunk in enc_passwords_chunks:
+      written += len(chunk)
+      yield chunk
+    if not written == enc_passwords_length:
+      raise ValueError("The encrypted passwords do not have the announced length.")
+  
+  # Yields the pieces of a JSON container holding fields, with enc_passwords taken from enc_passwords_chunks and base64-encoded as they arrive
+  def _make_json_chunks(self, fields, enc_passwords_chunks):
+    vault_contents = {}
+    for name in fields:
+      if name in self._BYTE_FIELDS and not name == "enc_passwords":
+        vault_contents[name] = base64.b64encode(fields[name]).decode(self._TEXT_ENCODING)
+      elif not name in self._BYTE_FIELDS:
+        vault_contents[name] = fields[name]
+    vault_contents["enc_passwords"] = ""
+    # The serialized object ends with "enc_passwords": ""}; the encoded chunks are written between the quotes
+    head = json.dumps(vault_contents)[:-2]
+    yield head.encode(self._TEXT_ENCODING)
+    remainder = b""
+    for chunk in enc_passwords_chunks:
+      data = remainder + bytes(chunk)
+      usable = len(data) - len(data) % 3
+      remainder = data[usable:]
+      yield base64.b64encode(data[:usable])
+    yield base64.b64encode(remainder) + b"\"}"
+  
+  # Replaces the file at path with the concatenation of chunks (bytes) atomically
+  # The chunks are written and synced to a temporary file in the same directory, which is then renamed over path; readers see either the old or the new file, never a partial one
+  # The permissions of an existing file are kept (new files are only accessible by their owner)
+  # Returns the number of bytes written
+  def write_atomic(self, path, chunks):
+    start = PasswordManagerStats.start()
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_handle, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    size = 0
+    try:
+      with os.fdopen(temp_handle, "wb") as vault_handle:
+        for chunk in chunks:
+          size += vault_handle.write(chunk)
+        vault_handle.flush()
+        os.fsync(vault_handle.fileno())
+      if os.path.isfile(path):
+        os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+      os.replace(temp_path, path)
+    except BaseException:
+      if os.path.isfile(temp_path):
+        os.remove(temp_path)
+      raise
+    self._sync_directory(directory)
+    PasswordManagerStats.stop("vault.file_write", start, size)
+    return size
+  
+  # Flushes a directory entry change (such as a rename) to disk where the OS supports it
+  def _sync_directory(self, directory):
+    if hasattr(os, "O_DIRECTORY"):
+      directory_handle = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+      try:
+        os.fsync(directory_handle)
+      finally:
+        os.close(directory_handle)
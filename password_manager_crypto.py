@@ -1,60 +1,162 @@
-import os, sys
-from Cryptodome import Random
-from Cryptodome.Cipher import AES
-from Cryptodome.Hash import HMAC, SHA256
-from Cryptodome.Protocol.KDF import PBKDF2
-
-# PasswordManagerCrypto
-# Allows for AES encryption of the vault via a master password
-
-# Class to provide AES-GCM cryptography
-# The password vault is unlocked by a master password that unlocks a 256-bit key used to encrypt the vault using a PBKDF2-derived key generated from the password and with random salt
-class PasswordManagerCrypto(object):
-  # Constants used for AES-GCM encryption
-  _DKLEN = 32 # Derived key length
-  _COUNT = 1000 # PBKDF2 iteration count value
-  _SALT_LENGTH = 32 # Salt length
-  
-  # Instance variables
-  _key = None
-  
-  # Constructor: initially starts out with blank key
-  def __init__(self):
-    self._key = None
-  
-  # Generates a random 256-bit key, encrypts it with a PBKDF2 key derived from the given password, and returns the encrypted key and salt
-  # The random key is stored in the instance to be able to encrypt and decrypt data with it
-  def generate_key(self, password):
-    random_key = Random.get_random_bytes(self._DKLEN)
-    salt = Random.get_random_bytes(self._SALT_LENGTH)
-    kdf = PBKDF2(password, salt, self._DKLEN, self._COUNT)
-    self._key = kdf
-    enc_key = self.encrypt(random_key)
-    self._key = random_key
-    return {"enc_key": enc_key, "salt": salt}
-  
-  # Unlocks the real encryption key used for data, encrypted by the PBKDF2-derived key based on the password
-  # The real key is stored in this instance to be able to encrypt and decrypt data
-  # ValueError thrown if decryption failed; caught by the caller to allow user to reenter password
-  def unlock_key(self, password, enc_key, salt):
-    self._key = PBKDF2(password, salt, self._DKLEN, self._COUNT)
-    self._key = self.decrypt(enc_key)
-  
-  # Encrypt data using AES-GCM and current key value
-  # Returns bytes with tag, nonce, and ciphertext
-  def encrypt(self, data):
-    cipher = AES.new(self._key, AES.MODE_GCM)
-    ciphertext, tag = cipher.encrypt_and_digest(data)
-    return tag + cipher.nonce + ciphertext
-  
-  # Decrypt data using the current key - assumed to consist of bytes: authentication tag (16 bytes) + nonce (16 bytes) + ciphertext
-  # Returns decrypted data as bytes
-  # ValueError thrown if decryption failed; caught by the caller to allow user to reenter password
-  def decrypt(self, data):
-    tag = data[0:16]
-    nonce = data[16:32]
-    ciphertext = data[32:]
-    cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
-    decrypted = cipher.decrypt_and_verify(ciphertext, tag)
-    return decrypted
-
+from Cryptodome import Random
+from Cryptodome.Cipher import AES
+from password_manager_stats import PasswordManagerStats
+
+# PasswordManagerCrypto
+# Allows for AES encryption of the vault via a master password
+
+# Class to provide AES-GCM cryptography
+# The password vault is unlocked by a master password that unlocks a 256-bit key used to encrypt the vault using a PBKDF2-derived key generated from the password and with random salt
+class PasswordManagerCrypto(object):
+  # Constants used for AES-GCM encryption
+  _DKLEN = 32 # Derived key length
+  _COUNT = 1000 # PBKDF2 iteration count value
+  _SALT_LENGTH = 32 # Salt length
+  _KDF_ALGORITHMS = ("PBKDF2-HMAC-SHA1", "PBKDF2-HMAC-SHA256") # PBKDF2-HMAC-SHA1 is what PBKDF2 uses by default
+  _DEFAULT_KDF = {"algorithm": "PBKDF2-HMAC-SHA1", "iterations": _COUNT} # KDF parameters of vaults that do not store their own
+  _STREAM_CHUNK = 1024 * 1024 # Size of the pieces encrypt_stream works on
+  
+  # Instance variables
+  _key = None
+  
+  # Constructor: initially starts out with blank key
+  def __init__(self):
+    self._key = None
+  
+  # Returns the KDF parameters used when none are given: a dictionary with algorithm and iterations keys
+  def get_default_kdf(self):
+    return dict(self._DEFAULT_KDF)
+  
+  # Generates a random 256-bit key, encrypts it with a PBKDF2 key derived from the given password, and returns the encrypted key, salt and KDF parameters
+  # kdf (optional) is a dictionary with algorithm and iterations keys (see get_default_kdf)
+  # The random key is stored in the instance to be able to encrypt and decrypt data with it
+  def generate_key(self, password, kdf=None):
+    self.clear_key()
+    self._key = bytearray(Random.get_random_bytes(self._DKLEN))
+    return self.wrap_key(password, kdf)
+  
+  # Encrypts the key held by this instance with a key derived from the given password and a new random salt, and returns the encrypted key, salt and KDF parameters
+  # Used to change the master password without touching the data encrypted with the key
+  def wrap_key(self, password, kdf=None):
+    if kdf == None:
+      kdf = self.get_default_kdf()
+    salt = Random.get_random_bytes(self._SALT_LENGTH)
+    data_key = self._key
+    self._key = self._derive_key(password, salt, kdf)
+    try:
+      enc_key = self.encrypt(data_key)
+    finally:
+      self.clear_key()
+      self._key = data_key
+    return {"enc_key": enc_key, "salt": salt, "kdf": dict(kdf)}
+  
+  # Unlocks the real encryption key used for data, encrypted by the PBKDF2-derived key based on the password
+  # kdf (optional) holds the KDF parameters stored with the encrypted key (see get_default_kdf)
+  # The real key is stored in this instance to be able to encrypt and decrypt data
+  # ValueError thrown if decryption failed; caught by the caller to allow user to reenter password
+  def unlock_key(self, password, enc_key, salt, kdf=None):
+    self.clear_key()
+    self._key = self._derive_key(password, salt, kdf)
+    try:
+      key = bytearray(self.decrypt(enc_key))
+    finally:
+      self.clear_key()
+    self._key = key
+  
+  # Returns a copy of the unlocked key held by this instance as a bytearray, which the caller should overwrite once done with it
+  # Used to hand the key to the unlock agent (see PasswordManagerAgent)
+  def export_key(self):
+    return bytearray(self._key)
+  
+  # Replaces the key held by this instance with a copy of an unlocked key (such as one returned by the unlock agent), skipping the key derivation
+  def import_key(self, key):
+    self.clear_key()
+    self._key = bytearray(key)
+  
+  # Overwrites the key held by this instance with zeros and forgets it
+  # Keys are kept in bytearrays so that they can be overwritten; copies made inside the cipher library cannot be reached
+  def clear_key(self):
+    if isinstance(self._key, bytearray):
+      self._key[:] = bytes(len(self._key))
+    self._key = None
+  
+  # Derives the key that encrypts the real key from the password and salt using PBKDF2 with the given KDF parameters (default: get_default_kdf)
+  # The KDF module is imported here since it is only needed when a key is derived
+  # ValueError thrown if the KDF parameters are not supported
+  def _derive_key(self, password, salt, kdf=None):
+    from Cryptodome.Protocol.KDF import PBKDF2
+    if kdf == None:
+      kdf = self._DEFAULT_KDF
+    iterations = kdf.get("iterations")
+    if not kdf.get("algorithm") in self._KDF_ALGORITHMS or not isinstance(iterations, int) or isinstance(iterations, bool) or iterations < 1:
+      raise ValueError("Unsupported KDF parameters: the algorithm must be one of " + ", ".join(self._KDF_ALGORITHMS) + " and iterations a positive integer.")
+    start = PasswordManagerStats.start()
+    if kdf["algorithm"] == "PBKDF2-HMAC-SHA256":
+      from Cryptodome.Hash import SHA256
+      derived_key = bytearray(PBKDF2(password, salt, self._DKLEN, iterations, hmac_hash_module=SHA256))
+    else:
+      derived_key = bytearray(PBKDF2(password, salt, self._DKLEN, iterations))
+    PasswordManagerStats.stop("crypto.pbkdf2", start)
+    return derived_key
+  
+  # Returns a new AES-GCM cipher keyed with a key derived from passphrase and salt with the given KDF parameters, for data protected by its own passphrase (such as exports)
+  # nonce is given when decrypting; a random one is chosen otherwise (read from the nonce attribute of the cipher)
+  # The key held by this instance is neither used nor changed
+  def new_passphrase_cipher(self, passphrase, salt, kdf, nonce=None):
+    derived_key = self._derive_key(passphrase, salt, kdf)
+    try:
+      if nonce == None:
+        return AES.new(derived_key, AES.MODE_GCM)
+      return AES.new(derived_key, AES.MODE_GCM, nonce=nonce)
+    finally:
+      derived_key[:] = bytes(len(derived_key))
+  
+  # Encrypt data using AES-GCM and current key value
+  # Returns bytes with tag, nonce, and ciphertext
+  def encrypt(self, data):
+    start = PasswordManagerStats.start()
+    cipher = AES.new(self._key, AES.MODE_GCM)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    encrypted = tag + cipher.nonce + ciphertext
+    PasswordManagerStats.stop("crypto.encrypt", start, len(data))
+    return encrypted
+  
+  # Decrypt data using the current key - assumed to consist of bytes: authentication tag (16 bytes) + nonce (16 bytes) + ciphertext
+  # Returns decrypted data as bytes
+  # ValueError thrown if decryption failed; caught by the caller to allow user to reenter password
+  def decrypt(self, data):
+    start = PasswordManagerStats.start()
+    tag = data[0:16]
+    nonce = data[16:32]
+    ciphertext = data[32:]
+    cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+    decrypted = cipher.decrypt_and_verify(ciphertext, tag)
+    PasswordManagerStats.stop("crypto.decrypt", start, len(data))
+    return decrypted
+  
+  # Encrypts data given as chunks without holding all of it in memory, producing the same format as encrypt()
+  # make_chunks is called twice and must return an iterable yielding the same bytes both times: the first pass computes the authentication tag, which the format stores first
+  # Returns (length, chunks): the length of the encrypted data and an iterable of its pieces (the second pass runs as it is consumed)
+  # ValueError thrown from the iterable if the data changed between the passes
+  def encrypt_stream(self, make_chunks):
+    start = PasswordManagerStats.start()
+    cipher = AES.new(self._key, AES.MODE_GCM)
+    nonce = cipher.nonce
+    length = 0
+    for chunk in make_chunks():
+      for offset in range(0, len(chunk), self._STREAM_CHUNK):
+        length += len(cipher.encrypt(chunk[offset:offset + self._STREAM_CHUNK]))
+    tag = cipher.digest()
+    PasswordManagerStats.stop("crypto.encrypt_stream", start, length)
+    return (len(tag) + len(nonce) + length, self._encrypt_stream_pass(make_chunks, nonce, tag))
+  
+  # Second pass of encrypt_stream: yields the tag, the nonce and then the ciphertext
+  def _encrypt_stream_pass(self, make_chunks, nonce, tag):
+    yield tag + nonce
+    cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+    for chunk in make_chunks():
+      for offset in range(0, len(chunk), self._STREAM_CHUNK):
+        yield cipher.encrypt(chunk[offset:offset + self._STREAM_CHUNK])
+    if not cipher.digest() == tag:
+      raise ValueError("The data changed while it was being encrypted.")
+
@@ -0,0 +1,96 @@
+import collections.abc
+import gc
+import json
+from json.encoder import encode_basestring_ascii
+
+# PasswordManagerEntry
+# Compact in-memory form of a vault entry (a site and its stored password)
+
+# Class holding one entry in two slots instead of a dictionary, which takes about 56 bytes per entry instead of about 190 (besides the strings)
+# Entries are read-only mappings with site and password keys, so code written for the {"site": ..., "password": ...} dictionaries of the vault JSON keeps working (entry["site"], dict(entry), comparison with dictionaries)
+# Entries are immutable (their attributes cannot be assigned), since the vault hands out the entries it stores (see PasswordManager.iter_passwords) and indexes them by site
+# The vault JSON is unchanged: loads() and dumps() read and write the same text as json.loads and json.dumps of the dictionaries
+class PasswordManagerEntry(collections.abc.Mapping):
+  __slots__ = ("site", "password")
+  
+  # Constants
+  _KEYS = ("site", "password")
+  
+  # Constructor
+  # site is the site of the entry, password the stored password (sealed if per-entry encryption is on)
+  def __init__(self, site, password):
+    _set_site(self, site)
+    _set_password(self, password)
+  
+  # Entries cannot be changed; store a new entry instead
+  def __setattr__(self, name, value):
+    raise AttributeError("PasswordManagerEntry is read-only.")
+  
+  # Entries cannot be changed
+  def __delattr__(self, name):
+    raise AttributeError("PasswordManagerEntry is read-only.")
+  
+  # Lets copy and pickle recreate the entry through the constructor
+  def __reduce__(self):
+    return (self.__class__, (self.site, self.password))
+  
+  # Returns the value of the site or password key
+  def __getitem__(self, key):
+    if key == "site":
+      return self.site
+    if key == "password":
+      return self.password
+    raise KeyError(key)
+  
+  # Checks whether key is one of the keys of an entry
+  def __contains__(self, key):
+    return key == "site" or key == "password"
+  
+  # Iterates over the keys of an entry
+  def __iter__(self):
+    return iter(self._KEYS)
+  
+  # Returns the number of keys of an entry
+  def __len__(self):
+    return 2
+  
+  # Returns the representation of the entry as a dictionary
+  def __repr__(self):
+    return repr(self.to_dict())
+  
+  # Returns the entry as a new dictionary
+  def to_dict(self):
+    return {"site": self.site, "password": self.password}
+  
+  # Returns the entries held by the JSON text of a list of entry objects (as written by dumps)
+  # The garbage collector is paused while the entries are created: entries hold only strings, so no cycles can form, and collections triggered by a million new objects would otherwise scan them again and again
+  # Raises KeyError if an object lacks the site or password key
+  @classmethod
+  def loads(cls, entries_json):
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+      return json.loads(entries_json, object_hook=cls._from_object)
+    finally:
+      if gc_enabled:
+        gc.enable()
+  
+  # Returns the entry for a decoded JSON object
+  # The entry is made without calling __init__, since this runs once per entry of a vault
+  @classmethod
+  def _from_object(cls, entry_object):
+    entry = _new_object(cls)
+    _set_site(entry, entry_object["site"])
+    _set_password(entry, entry_object["password"])
+    return entry
+  
+  # Returns the JSON text of a list of entries, the same text as json.dumps of the list of their dictionaries
+  # The strings are escaped by the C encoder of the json module; only the fixed parts of each object are added here
+  @classmethod
+  def dumps(cls, entries):
+    return "[" + ", ".join(['{"site": %s, "password": %s}' % (encode_basestring_ascii(entry.site), encode_basestring_ascii(entry.password)) for entry in entries]) + "]"
+
+# Setters of the slots of PasswordManagerEntry, which bypass its read-only __setattr__
+_new_object = object.__new__
+_set_site = PasswordManagerEntry.site.__set__
+_set_password = PasswordManagerEntry.password.__set__
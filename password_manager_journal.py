@@ -0,0 +1,90 @@
+import base64
+import os
+import tempfile
+
+# PasswordManagerJournal
+# Append-only log of change records kept next to a journal-format vault
+
+# Class to read and append the records of a vault journal
+# The first line of the file is the identifier of the vault snapshot the journal belongs to
+# Every following line is one record (already sealed by the caller) encoded in base64
+class PasswordManagerJournal(object):
+  # Constants
+  _TEXT_ENCODING = "UTF-8"
+  
+  # Instance variables
+  _path = None
+  
+  # Constructor
+  # path is the path of the journal file
+  def __init__(self, path):
+    self._path = path
+  
+  # Returns the path of the journal file
+  def get_path(self):
+    return self._path
+  
+  # Returns the size of the journal file in bytes (0 if nonexistant)
+  def size(self):
+    if os.path.isfile(self._path):
+      return os.path.getsize(self._path)
+    return 0
+  
+  # Starts a new empty journal belonging to the snapshot identified by journal_id
+  # The new journal is written to a temporary file and renamed over the old one, so readers see either journal complete
+  # Returns the size of the new journal in bytes
+  def reset(self, journal_id):
+    header = (journal_id + "\n").encode(self._TEXT_ENCODING)
+    directory = os.path.dirname(os.path.abspath(self._path))
+    temp_handle, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self._path) + ".", suffix=".tmp")
+    try:
+      try:
+        os.write(temp_handle, header)
+        os.fsync(temp_handle)
+      finally:
+        os.close(temp_handle)
+      os.replace(temp_path, self._path)
+    except BaseException:
+      if os.path.isfile(temp_path):
+        os.remove(temp_path)
+      raise
+    return len(header)
+  
+  # Appends records (bytes) to the journal after the first offset bytes and flushes them to disk
+  # offset is the end of the last complete record (from read or a previous append); anything after it was left by an interrupted append and is discarded
+  # Returns the new end offset
+  def append(self, records, offset):
+    lines = b"".join([base64.b64encode(record) + b"\n" for record in records])
+    journal_handle = open(self._path, "r+b")
+    journal_handle.truncate(offset)
+    journal_handle.seek(offset)
+    journal_handle.write(lines)
+    journal_handle.flush()
+    os.fsync(journal_handle.fileno())
+    journal_handle.close()
+    return offset + len(lines)
+  
+  # Returns (records, end offset): the records (bytes) in the journal after the first offset bytes, and the end of the last complete record
+  # offset must be 0 or an end offset returned earlier for the same journal_id
+  # Returns ([], 0) if the journal is nonexistant or belongs to a different snapshot than journal_id
+  # An incomplete last line (left by an interrupted append) is ignored
+  def read(self, journal_id, offset=0):
+    if not os.path.isfile(self._path):
+      return ([], 0)
+    journal_handle = open(self._path, "rb")
+    header = journal_handle.readline()
+    if not header.endswith(b"\n") or not header[:-1].decode(self._TEXT_ENCODING) == journal_id:
+      journal_handle.close()
+      return ([], 0)
+    offset = max(offset, len(header))
+    journal_handle.seek(offset)
+    journal_contents = journal_handle.read()
+    journal_handle.close()
+    complete_length = journal_contents.rfind(b"\n") + 1
+    lines = journal_contents[:complete_length].split(b"\n")[:-1]
+    return ([base64.b64decode(line) for line in lines], offset + complete_length)
+  
+  # Deletes the journal file (does nothing if nonexistant)
+  def remove(self):
+    if os.path.isfile(self._path):
+      os.remove(self._path)
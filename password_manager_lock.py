@@ -0,0 +1,72 @@
+import contextlib
+
+# fcntl is only available on POSIX systems; elsewhere the lock does nothing
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# PasswordManagerLock
+# Advisory lock that lets several processes share one vault
+
+# Class to hold an advisory lock (flock) on a lock file next to the vault
+# Readers take the lock shared and writers take it exclusive, so any number of processes can read while a write is not in progress
+# The lock is reentrant within one instance; a shared lock cannot be upgraded to an exclusive one while it is held
+class PasswordManagerLock(object):
+  # Instance variables
+  _path = None
+  _handle = None
+  _depth = 0
+  _exclusive = False
+  
+  # Constructor
+  # path is the path of the lock file (created if nonexistant)
+  def __init__(self, path):
+    self._path = path
+    self._handle = None
+    self._depth = 0
+    self._exclusive = False
+  
+  # Context manager holding the lock shared (for reading the vault)
+  @contextlib.contextmanager
+  def shared(self):
+    self._acquire(False)
+    try:
+      yield
+    finally:
+      self._release()
+  
+  # Context manager holding the lock exclusive (for writing the vault)
+  @contextlib.contextmanager
+  def exclusive(self):
+    self._acquire(True)
+    try:
+      yield
+    finally:
+      self._release()
+  
+  # Takes the lock, waiting for other processes if needed
+  def _acquire(self, exclusive):
+    if self._depth > 0:
+      if exclusive and not self._exclusive:
+        raise ValueError("A shared vault lock cannot be upgraded to an exclusive lock.")
+      self._depth += 1
+      return
+    if not fcntl == None:
+      self._handle = open(self._path, "a+b")
+      try:
+        fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+      except BaseException:
+        self._handle.close()
+        self._handle = None
+        raise
+    self._exclusive = exclusive
+    self._depth = 1
+  
+  # Gives up one level of the lock, releasing it when the outermost holder is done
+  def _release(self):
+    self._depth -= 1
+    if self._depth == 0 and not self._handle == None:
+      fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+      self._handle.close()
+      self._handle = None
@@ -0,0 +1,241 @@
+import contextlib
+import hashlib
+import hmac
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from password_manager import PasswordManager
+
+# VaultPool
+# In-process cache of unlocked vaults, so that a service handling many requests for the same vaults only pays for PBKDF2, decryption and parsing once per vault
+
+# Class to keep unlocked PasswordManager instances keyed by vault path
+# Vaults are evicted least recently used first once the pool holds more than max_vaults vaults or more than max_bytes bytes of entries (approximate, see PasswordManager.get_data_size)
+# Vaults unused for idle_timeout seconds are evicted as well, by a daemon thread that checks for them every _EXPIRY_CHECKS-th of idle_timeout until close(); evicted vaults are closed, which overwrites their data keys and drops their entries
+# The master password of a cached vault is checked against an HMAC-SHA256 of it keyed with a random key of the pool, so a hit costs no key derivation and the password itself is never stored by the pool
+# Managers are borrowed with acquire() and given back with release() (or both with the vault() context manager); a borrowed manager is never closed: a vault evicted while in use is closed on its last release
+# The pool is thread safe, but a PasswordManager is not, so borrowers of one vault take turns: acquire() waits until the current borrower releases the vault (a thread must not acquire a vault it already holds)
+class VaultPool(object):
+  # Constants
+  _EXPIRY_CHECKS = 4 # Idle checks per idle_timeout
+  _MIN_EXPIRY_INTERVAL = 0.05 # Seconds
+  
+  # Instance variables
+  _max_vaults = 0
+  _max_bytes = 0
+  _idle_timeout = None
+  _options = None
+  _verifier_key = None
+  _lock = None
+  _vaults = None # Absolute vault path -> dictionary with manager, verifier, size, last_used, borrowers (current and waiting) and turn (a lock held by the current borrower) keys, least recently used first
+  _retired = None # Removed vaults that are still borrowed
+  _size = 0
+  _hits = 0
+  _misses = 0
+  _evictions = 0
+  _expirations = 0
+  _expiry_stop = None # Event set by close() to stop the idle eviction thread
+  
+  # Constructor
+  # max_vaults and max_bytes bound the number of cached vaults and the approximate bytes of their entries
+  # idle_timeout is the number of seconds after which an unused vault is evicted (None to keep vaults until evicted by the bounds)
+  # options are passed to PasswordManager when a vault is opened (vault_format, entry_encryption and container_format)
+  def __init__(self, max_vaults=16, max_bytes=64 * 1024 * 1024, idle_timeout=300.0, **options):
+    if max_vaults < 1 or max_bytes < 0:
+      raise ValueError("max_vaults must be at least 1 and max_bytes must not be negative.")
+    self._max_vaults = max_vaults
+    self._max_bytes = max_bytes
+    self._idle_timeout = idle_timeout
+    self._options = options
+    self._verifier_key = os.urandom(32)
+    self._lock = threading.Lock()
+    self._vaults = OrderedDict()
+    self._retired = []
+    self._size = 0
+    self._hits = 0
+    self._misses = 0
+    self._evictions = 0
+    self._expirations = 0
+    self._expiry_stop = threading.Event()
+    if not idle_timeout == None:
+      interval = max(idle_timeout / self._EXPIRY_CHECKS, self._MIN_EXPIRY_INTERVAL)
+      # The thread only holds a weak reference, so that a pool dropped without close() can still be collected
+      threading.Thread(target=VaultPool._expire_idle, args=(weakref.ref(self), self._expiry_stop, interval), daemon=True).start()
+  
+  # Returns the unlocked PasswordManager for the vault at vault_path (opened, or created if nonexistant, on a miss)
+  # Waits while another borrower holds the vault
+  # A cached vault whose verifier does not match master_password is opened again (the master password may have been changed by another process), so a wrong master password still costs a key derivation
+  # On a hit the password is also checked against the manager, whose master password may have been changed by a borrower since the vault was cached
+  # Raises ValueError if master_password is not the master password of the vault
+  # The manager must be given back with release() when the caller is done with it
+  def acquire(self, vault_path, master_password):
+    key = os.path.abspath(vault_path)
+    verifier = self._get_verifier(master_password)
+    while True:
+      with self._lock:
+        self._evict_idle()
+        vault = self._vaults.get(key)
+        if not vault == None and hmac.compare_digest(vault["verifier"], verifier):
+          vault["borrowers"] += 1
+          self._vaults.move_to_end(key)
+        else:
+          vault = None
+      if vault == None:
+        break
+      # Waiting borrowers are counted in borrowers, so the vault is not closed while they wait
+      vault["turn"].acquire()
+      with self._lock:
+        cached = self._vaults.get(key) is vault
+      if not cached:
+        # Evicted while waiting (for example discarded by the previous borrower); look it up again
+        self.release(vault["manager"])
+        continue
+      try:
+        vault["manager"].refresh()
+        current = vault["manager"].check_master_password(master_password)
+      except ValueError:
+        # The vault on disk no longer opens with the cached key; open it again below
+        self.release(vault["manager"], discard=True)
+        break
+      except BaseException:
+        self.release(vault["manager"], discard=True)
+        raise
+      if not current:
+        # The master password was changed through the pooled manager since the verifier was stored; open the vault again below, which rejects the old password
+        self.release(vault["manager"], discard=True)
+        break
+      with self._lock:
+        self._hits += 1
+      return vault["manager"]
+    # Miss: open the vault outside the pool lock so that other vaults stay available during the key derivation
+    # Concurrent misses on one vault each open their own manager; the vault file lock orders their writes
+    with self._lock:
+      self._misses += 1
+    manager = PasswordManager(vault_path, master_password, **self._options)
+    with self._lock:
+      vault = self._vaults.get(key)
+      if not vault == None:
+        self._evict(key)
+      vault = {"manager": manager, "verifier": verifier, "size": manager.get_data_size(), "last_used": time.monotonic(), "borrowers": 1, "turn": threading.Lock()}
+      vault["turn"].acquire()
+      self._vaults[key] = vault
+      self._size += vault["size"]
+      self._evict_over_bounds()
+    return manager
+  
+  # Gives back a manager returned by acquire(), letting the next waiting borrower of the vault have it
+  # If discard is true the vault is evicted (for example after an error left the manager in an unknown state)
+  def release(self, manager, discard=False):
+    with self._lock:
+      for key, vault in self._vaults.items():
+        if vault["manager"] is manager:
+          vault["borrowers"] -= 1
+          vault["last_used"] = time.monotonic()
+          self._size += manager.get_data_size() - vault["size"]
+          vault["size"] = manager.get_data_size()
+          self._vaults.move_to_end(key)
+          if discard:
+            self._evict(key)
+          self._evict_over_bounds()
+          vault["turn"].release()
+          return
+      for vault in self._retired:
+        if vault["manager"] is manager:
+          vault["borrowers"] -= 1
+          if vault["borrowers"] == 0:
+            self._retired.remove(vault)
+            manager.close()
+          vault["turn"].release()
+          return
+  
+  # Context manager that acquires the manager of a vault and releases it on exit
+  @contextlib.contextmanager
+  def vault(self, vault_path, master_password):
+    manager = self.acquire(vault_path, master_password)
+    try:
+      yield manager
+    except BaseException:
+      # The manager may hold changes that failed to save; open the vault again next time
+      self.release(manager, discard=True)
+      raise
+    self.release(manager)
+  
+  # Evicts the vault at vault_path if it is cached
+  def evict(self, vault_path):
+    with self._lock:
+      key = os.path.abspath(vault_path)
+      if key in self._vaults:
+        self._evict(key)
+  
+  # Evicts the vaults that have been idle for longer than the idle timeout
+  def evict_idle(self):
+    with self._lock:
+      self._evict_idle()
+  
+  # Evicts every vault and stops the idle eviction thread
+  def close(self):
+    self._expiry_stop.set()
+    with self._lock:
+      for key in list(self._vaults):
+        self._evict(key)
+  
+  # Returns the pool statistics: hits, misses, evictions (including expirations), expirations (idle evictions), vaults and bytes
+  def get_stats(self):
+    with self._lock:
+      return {"hits": self._hits, "misses": self._misses, "evictions": self._evictions, "expirations": self._expirations, "vaults": len(self._vaults), "bytes": self._size}
+  
+  # Returns the keyed hash of a master password stored to verify it on a hit
+  def _get_verifier(self, master_password):
+    return hmac.new(self._verifier_key, master_password.encode("UTF-8"), hashlib.sha256).digest()
+  
+  # Body of the idle eviction thread: evicts the idle vaults of the pool every interval seconds until stop is set or the pool is collected
+  @staticmethod
+  def _expire_idle(pool_ref, stop, interval):
+    while not stop.wait(interval):
+      pool = pool_ref()
+      if pool == None:
+        return
+      pool.evict_idle()
+      pool = None
+  
+  # Evicts the idle vaults; the vaults are ordered by last use, so the scan stops at the first vault used recently
+  # The caller must hold the pool lock
+  def _evict_idle(self):
+    if self._idle_timeout == None:
+      return
+    deadline = time.monotonic() - self._idle_timeout
+    for key in list(self._vaults):
+      vault = self._vaults[key]
+      if vault["last_used"] > deadline:
+        break
+      if vault["borrowers"] > 0:
+        continue
+      self._remove(key)
+      self._evictions += 1
+      self._expirations += 1
+  
+  # Evicts least recently used vaults until the pool is within its bounds; the most recently used vault is always kept
+  # The caller must hold the pool lock
+  def _evict_over_bounds(self):
+    for key in list(self._vaults)[:-1]:
+      if len(self._vaults) <= self._max_vaults and self._size <= self._max_bytes:
+        break
+      self._evict(key)
+  
+  # Evicts a vault
+  # The caller must hold the pool lock
+  def _evict(self, key):
+    self._remove(key)
+    self._evictions += 1
+  
+  # Removes a vault from the pool and closes its manager, or retires it until its last release if it is borrowed
+  # The caller must hold the pool lock
+  def _remove(self, key):
+    vault = self._vaults.pop(key)
+    self._size -= vault["size"]
+    if vault["borrowers"] == 0:
+      vault["manager"].close()
+    else:
+      self._retired.append(vault)
@@ -1,28 +1,308 @@
-import sys
-
-# PasswordManagerRunner
-# Starts an instance of PasswordManagerCLI
-
-# Check Python version (must be using 3)
-if (sys.version_info) < (3, 0):
-  print("ERROR: Python 3 is required. This program is currently running in Python 2.")
-  exit()
-
-# Check for crypto modules (install pycryptodomex module for this program to function)
-try:
-  from password_manager_cli import PasswordManagerCLI
-except:
-  print("The pycryptodomex module is not installed. Please install this module for the program to function.")
-  exit()
-
-cli = None
-cli_error = False
-
-try:
-  cli = PasswordManagerCLI()
-except:
-  cli_error = True
-  print("The initialization of the password vault file failed. Perhaps the path provided is an invalid OS path, or the file is corrupted.")
-  
-if not cli == None and not cli_error:
-  cli.enter_menu()
+import sys
+
+# PasswordManagerRunner
+# Starts an instance of PasswordManagerCLI, or runs a scripted command if command-line arguments are given
+# Run with --help for the scripted commands (get, generate/set, delete, list, exec, import, export, audit, agent)
+
+# Check Python version (must be using 3)
+if (sys.version_info) < (3, 0):
+  print("ERROR: Python 3 is required. This program is currently running in Python 2.")
+  exit()
+
+import os
+
+_PASSWORD_ENV_VARIABLE = "PASSWORD_MANAGER_MASTER_PASSWORD"
+_AGENT_ENV_VARIABLE = "PASSWORD_MANAGER_AGENT_SOCK"
+
+# Starts the interactive CLI
+def run_interactive():
+  import password_manager_crypto
+  from password_manager_cli import PasswordManagerCLI
+  cli = None
+  cli_error = False
+
+  try:
+    cli = PasswordManagerCLI(agent=make_agent_client())
+  except (OSError, ValueError, KeyError):
+    cli_error = True
+    print("The initialization of the password vault file failed. Perhaps the path provided is an invalid OS path, or the file is corrupted.")
+
+  if not cli == None and not cli_error:
+    cli.enter_menu()
+
+# Returns the argument parser for the scripted commands
+def make_parser():
+  import argparse
+  from password_manager_cli import PasswordManagerCLI
+  parser = argparse.ArgumentParser(description="Run password manager operations without prompts. Results are printed as JSON lines. Without arguments the interactive interface starts.")
+  parser.add_argument("--vault", default=PasswordManagerCLI._DEFAULT_PATH, help="path of the vault file (default: " + PasswordManagerCLI._DEFAULT_PATH + ")")
+  parser.add_argument("--create", action="store_true", help="create the vault if it does not exist")
+  password_source = parser.add_mutually_exclusive_group()
+  password_source.add_argument("--password-env", metavar="VARIABLE", default=_PASSWORD_ENV_VARIABLE, help="environment variable holding the master password (default: " + _PASSWORD_ENV_VARIABLE + ")")
+  password_source.add_argument("--password-fd", metavar="FD", type=int, help="file descriptor to read the master password from (first line)")
+  password_source.add_argument("--password-file", metavar="PATH", help="file to read the master password from (first line)")
+  commands = parser.add_subparsers(dest="command", metavar="command")
+  commands.required = True
+  get_command = commands.add_parser("get", help="print the password for a site")
+  get_command.add_argument("site")
+  for name in ("generate", "set"):
+    generate_command = commands.add_parser(name, help="generate and store a password for a site (replacing any existing one)")
+    generate_command.add_argument("length", type=int)
+    generate_command.add_argument("site")
+    generate_command.add_argument("phrase")
+  delete_command = commands.add_parser("delete", help="delete the password for a site")
+  delete_command.add_argument("site")
+  commands.add_parser("list", help="print every site and password")
+  exec_command = commands.add_parser("exec", help="run newline-delimited JSON commands from a file or standard input with one unlock and one save")
+  exec_command.add_argument("file", nargs="?", default="-", help="file of JSON commands (default: standard input)")
+  import_command = commands.add_parser("import", help="import entries from a CSV or JSON-lines file (site and password columns) with one save")
+  import_command.add_argument("file")
+  import_command.add_argument("--format", choices=("csv", "jsonl"), help="file format (default: from the extension)")
+  import_command.add_argument("--policy", choices=("skip", "replace", "fail"), default="skip", help="what to do with sites that already have a password (default: skip)")
+  import_command.add_argument("--passphrase-env", metavar="VARIABLE", help="environment variable holding the passphrase of an encrypted export")
+  export_command = commands.add_parser("export", help="export every entry to a CSV or JSON-lines file")
+  export_command.add_argument("file")
+  export_command.add_argument("--format", choices=("csv", "jsonl"), help="file format (default: from the extension)")
+  export_command.add_argument("--passphrase-env", metavar="VARIABLE", help="environment variable holding a passphrase to encrypt the export with")
+  audit_command = commands.add_parser("audit", help="print a JSON report of reused, short and weak passwords (no passwords are included)")
+  audit_command.add_argument("--details", action="store_true", help="include the findings for every entry")
+  agent_command = commands.add_parser("agent", help="start or control the unlock agent that keeps unlocked vault keys so that later commands skip the key derivation")
+  agent_command.add_argument("action", choices=("start", "stop", "lock", "forget", "list"), help="start the agent (prints shell commands setting " + _AGENT_ENV_VARIABLE + "), stop it, make it forget every key (lock) or the keys of --vault (forget), or list the vaults it holds")
+  agent_command.add_argument("--socket", metavar="PATH", help="socket path of the agent (default: a new private directory for start, " + _AGENT_ENV_VARIABLE + " otherwise)")
+  agent_command.add_argument("--ttl", type=float, metavar="SECONDS", help="seconds a key is kept after it was added (start only, default: 900)")
+  agent_command.add_argument("--foreground", action="store_true", help="run the agent in the foreground instead of as a background process (start only)")
+  return parser
+
+# Returns a client of the unlock agent named by the PASSWORD_MANAGER_AGENT_SOCK environment variable (None if it is not set)
+# The client module is only imported if an agent is used
+def make_agent_client():
+  if len(os.environ.get(_AGENT_ENV_VARIABLE, "")) == 0:
+    return None
+  from password_manager_agent_client import PasswordManagerAgentClient
+  return PasswordManagerAgentClient.from_environment()
+
+# Runs an agent command and returns the exit status (0 on success, 1 if the agent could not be reached or refused, 2 if no agent is given or it cannot start)
+# Every action but start prints its result as one JSON line
+def run_agent(args):
+  import json
+  from password_manager_agent_client import PasswordManagerAgentClient
+  if args.action == "start":
+    return start_agent(args)
+  if not args.socket == None:
+    client = PasswordManagerAgentClient(args.socket)
+  else:
+    client = make_agent_client()
+  if client == None:
+    sys.stderr.write("No agent given. Set " + _AGENT_ENV_VARIABLE + " or use --socket.\n")
+    return 2
+  result = {"op": "agent", "action": args.action}
+  try:
+    if args.action == "stop":
+      client.stop()
+    elif args.action == "lock":
+      result["forgotten"] = client.lock()
+    elif args.action == "forget":
+      result["forgotten"] = client.forget(args.vault)
+    else:
+      result["vaults"] = client.list_vaults()
+  except (OSError, ValueError) as e:
+    result["ok"] = False
+    result["error"] = str(e)
+    print(json.dumps(result))
+    return 1
+  result["ok"] = True
+  print(json.dumps(result))
+  return 0
+
+# Starts the unlock agent and prints shell commands that point later runs at it (for use with eval, like ssh-agent)
+# The agent runs in a background process unless --foreground is given (or the OS cannot fork)
+# Core dumps are turned off in the agent process, since they would write the keys it holds to disk
+def start_agent(args):
+  import shlex
+  import signal
+  import tempfile
+  from password_manager_agent import PasswordManagerAgent
+  socket_path = args.socket
+  directory = None
+  if socket_path == None:
+    directory = tempfile.mkdtemp(prefix="password-manager-agent-")
+    socket_path = os.path.join(directory, "agent.sock")
+  try:
+    if args.ttl == None:
+      agent = PasswordManagerAgent(socket_path)
+    else:
+      agent = PasswordManagerAgent(socket_path, args.ttl)
+    agent.bind()
+  except (OSError, ValueError) as e:
+    if not directory == None:
+      os.rmdir(directory)
+    sys.stderr.write("The agent could not be started: " + str(e) + "\n")
+    return 2
+  print(_AGENT_ENV_VARIABLE + "=" + shlex.quote(socket_path) + "; export " + _AGENT_ENV_VARIABLE + ";")
+  if not args.foreground and hasattr(os, "fork"):
+    pid = os.fork()
+    if pid > 0:
+      print("echo Agent pid " + str(pid) + ";")
+      return 0
+    os.setsid()
+    null_handle = os.open(os.devnull, os.O_RDWR)
+    for standard_handle in (0, 1, 2):
+      os.dup2(null_handle, standard_handle)
+    os.close(null_handle)
+  else:
+    print("echo Agent pid " + str(os.getpid()) + ";")
+    sys.stdout.flush()
+  try:
+    import resource
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+  except (ImportError, ValueError, OSError):
+    pass
+  for signal_name in ("SIGTERM", "SIGINT", "SIGHUP"):
+    if hasattr(signal, signal_name):
+      signal.signal(getattr(signal, signal_name), lambda signal_number, frame: agent.stop())
+  try:
+    agent.serve()
+  finally:
+    if not directory == None and os.path.isdir(directory):
+      os.rmdir(directory)
+  return 0
+
+# Runs an audit of the vault of manager and prints its report as one JSON line
+# Returns the exit status (0, even if the audit found weak passwords)
+def run_audit(manager, args):
+  import json
+  from password_manager_audit import PasswordManagerAudit
+  from password_manager_cli import PasswordManagerCLI
+  report = PasswordManagerAudit(manager, PasswordManagerCLI._MIN_RECOMMENDED_LENGTH).run(args.details)
+  report["op"] = "audit"
+  report["ok"] = True
+  print(json.dumps(report))
+  return 0
+
+# Prints a progress report of an import or export to standard error
+def print_progress(report):
+  line = str(report["rows"]) + " rows, " + str(report["bytes"]) + " bytes"
+  if not report["rows_per_second"] == None:
+    line += ", " + str(int(report["rows_per_second"])) + " rows/s"
+  sys.stderr.write(line + "\n")
+
+# Runs an import or export command against manager and prints its result as one JSON line
+# Returns the exit status
+def run_transfer(manager, args):
+  import json
+  from password_manager_transfer import PasswordManagerTransfer
+  passphrase = None
+  if not args.passphrase_env == None:
+    passphrase = os.environ.get(args.passphrase_env)
+    if passphrase == None or len(passphrase) == 0:
+      sys.stderr.write("The environment variable " + args.passphrase_env + " does not hold a passphrase.\n")
+      return 2
+  transfer = PasswordManagerTransfer(manager, print_progress)
+  try:
+    if args.command == "import":
+      result = transfer.import_file(args.file, args.format, args.policy, passphrase)
+    else:
+      result = transfer.export_file(args.file, args.format, passphrase)
+  except (OSError, ValueError) as e:
+    print(json.dumps({"op": args.command, "ok": False, "error": str(e)}))
+    return 1
+  result["op"] = args.command
+  result["ok"] = True
+  print(json.dumps(result))
+  return 0
+
+# Returns the master password from the source selected in args (None if unavailable)
+def read_master_password(args):
+  if not args.password_fd == None:
+    password_handle = os.fdopen(args.password_fd, "r")
+    master_password = password_handle.readline()
+    password_handle.close()
+  elif not args.password_file == None:
+    password_handle = open(args.password_file, "r")
+    master_password = password_handle.readline()
+    password_handle.close()
+  else:
+    master_password = os.environ.get(args.password_env)
+  if master_password == None:
+    return None
+  return master_password.rstrip("\r\n")
+
+# Runs a scripted command and returns the exit status (0 on success, 1 if a command failed, 2 if the master password, the vault or the command file could not be read)
+def run_script(argv):
+  import json
+  from password_manager import PasswordManager
+  from password_manager_batch import PasswordManagerBatch
+  args = make_parser().parse_args(argv)
+  if args.command == "agent":
+    return run_agent(args)
+  try:
+    master_password = read_master_password(args)
+  except OSError as e:
+    sys.stderr.write("The master password could not be read: " + str(e) + "\n")
+    return 2
+  if master_password == None or len(master_password) == 0:
+    sys.stderr.write("No master password given. Set " + args.password_env + " or use --password-fd or --password-file.\n")
+    return 2
+  if not os.path.isfile(args.vault) and not args.create:
+    sys.stderr.write("The vault " + args.vault + " does not exist. Use --create to create it.\n")
+    return 2
+  try:
+    manager = PasswordManager(args.vault, master_password, agent=make_agent_client())
+  except ValueError:
+    sys.stderr.write("The password is incorrect.\n")
+    return 2
+  except (OSError, KeyError):
+    sys.stderr.write("The initialization of the password vault file failed. Perhaps the path provided is an invalid OS path, or the file is corrupted.\n")
+    return 2
+  if args.command in ("import", "export"):
+    return run_transfer(manager, args)
+  if args.command == "audit":
+    return run_audit(manager, args)
+  batch = PasswordManagerBatch(manager)
+  if args.command == "exec":
+    if args.file == "-":
+      batch.run(sys.stdin, sys.stdout)
+    else:
+      try:
+        commands_handle = open(args.file, "r")
+      except OSError as e:
+        sys.stderr.write("The command file could not be read: " + str(e) + "\n")
+        return 2
+      batch.run(commands_handle, sys.stdout)
+      commands_handle.close()
+  else:
+    command = {"op": args.command}
+    for key in ("site", "length", "phrase"):
+      if key in args:
+        command[key] = getattr(args, key)
+    try:
+      result = batch.execute(command)
+    except OSError as e:
+      sys.stderr.write("The password vault file could not be saved: " + str(e) + "\n")
+      return 1
+    print(json.dumps(result))
+  if batch.get_failures() > 0:
+    return 1
+  return 0
+
+# Runs a scripted command if argv (default: the command-line arguments) is nonempty, otherwise the interactive CLI
+# Returns the exit status
+# The modules of the password manager are imported by the functions above when an operation needs them, so that startup stays fast
+def main(argv=None):
+  if argv == None:
+    argv = sys.argv[1:]
+  # Check for crypto modules (install pycryptodomex module for this program to function)
+  # Any other import error is a real error and is not hidden
+  try:
+    if len(argv) > 0:
+      return run_script(argv)
+    run_interactive()
+  except ImportError as e:
+    if e.name == None or not e.name.split(".")[0] == "Cryptodome":
+      raise
+    print("The pycryptodomex module is not installed. Please install this module for the program to function.")
+    return 1
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
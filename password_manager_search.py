@@ -0,0 +1,181 @@
+import collections
+import heapq
+import itertools
+
+# PasswordManagerSearchIndex
+# Trigram index over site names for substring and fuzzy site search
+
+# Class holding an inverted index from the trigrams of each site (lowercase, padded with spaces at the ends) to the sites containing them
+# Sites cannot contain spaces, so padding marks the start and end of a site and lets prefix matches rank higher
+# Searching only visits the sites sharing trigrams with the query, so it never scans every site, and at most _MAX_CANDIDATES sites are examined per kind of match
+# With more candidates than that (a query like "com"), the best results among the examined sites are returned, so the order past the exact and prefix matches is approximate
+class PasswordManagerSearchIndex(object):
+  # Constants
+  _MIN_SHARED_RATIO = 0.5 # Fraction of the trigrams of a query that a site must share with it to be a fuzzy match
+  _SHORT_QUERY_MAX_SITES = 10000 # Maximum number of sites examined for queries shorter than a trigram
+  _MAX_CANDIDATES = 5000 # Maximum number of sites examined for prefix matches, for substring matches and per trigram for fuzzy matches
+  _MAX_FUZZY_CANDIDATES = 200 # Maximum number of sites (sharing the most trigrams) checked for being a fuzzy match
+  _MIN_EDIT_QUERY = 4 # Minimum query length for matching by edit distance
+  _EDIT_SHARED = 2 # Trigrams a site must share with the query to be checked by edit distance
+  _EDIT_SEPARATORS = ".-_@/:" # Characters after which a part of a site that a misspelled query is compared to can start
+  
+  # Instance variables
+  _postings = None # Trigram -> set of sites containing it
+  _size = 0
+  
+  # Constructor
+  # sites (optional) is an iterable of sites to index
+  def __init__(self, sites=()):
+    self._postings = {}
+    self._size = 0
+    for site in sites:
+      self.add(site)
+  
+  # Returns the number of indexed sites
+  def size(self):
+    return self._size
+  
+  # Returns the set of trigrams of a string (case-insensitive, padded with spaces)
+  def _get_trigrams(self, string):
+    padded = "  " + string.lower() + " "
+    return set([padded[i:i + 3] for i in range(len(padded) - 2)])
+  
+  # Adds a site to the index (the site must not already be indexed)
+  def add(self, site):
+    for trigram in self._get_trigrams(site):
+      postings = self._postings.get(trigram)
+      if postings == None:
+        postings = set()
+        self._postings[trigram] = postings
+      postings.add(site)
+    self._size += 1
+  
+  # Removes a site from the index (the site must be indexed)
+  def remove(self, site):
+    for trigram in self._get_trigrams(site):
+      postings = self._postings[trigram]
+      postings.discard(site)
+      if len(postings) == 0:
+        del self._postings[trigram]
+    self._size -= 1
+  
+  # Returns up to limit sites matching query, best first (case-insensitive)
+  # Exact matches rank first, then sites starting with the query, then sites containing it (shorter sites first), then fuzzy matches (most similar first)
+  # A fuzzy match shares enough trigrams with the query, or a part of it (at its start or after a separator such as ".") is at most one or two edits (insertion, deletion, substitution or swap of adjacent characters) away from the query, which catches typos that change most trigrams of a short query
+  # Fuzzy matches are only looked for if fewer than limit sites contain the query
+  def search(self, query, limit=10):
+    query = query.lower()
+    if len(query) == 0 or limit < 1:
+      return []
+    if len(query) < 3:
+      ranked = self._get_short_query_matches(query, limit)
+    else:
+      ranked = self._get_substring_matches(query, limit)
+      if len(ranked) < limit:
+        ranked.extend(self._get_similar_sites(query, set([key[-1] for key in ranked])))
+    return [key[-1] for key in heapq.nsmallest(limit, ranked)]
+  
+  # Returns the ranking key of a site containing query: exact match, then prefix match, then substring match, shorter sites first
+  # Keys of fuzzy matches (see _get_similar_sites) have the same shape, so that all keys compare
+  def _get_match_key(self, site, query):
+    lower_site = site.lower()
+    if lower_site == query:
+      return (0, 0, 0.0, len(site), site)
+    if lower_site.startswith(query):
+      return (1, 0, 0.0, len(site), site)
+    return (2, 0, 0.0, len(site), site)
+  
+  # Returns the ranking keys of the best (up to limit) sites containing query, which has at least 3 characters
+  # Sites starting with the query contain its second padded trigram, whose postings are checked first; if they give limit matches, sites containing the query elsewhere cannot rank among the results
+  # Otherwise a site containing the query contains every trigram inside it, so only the postings of the rarest of them are checked
+  def _get_substring_matches(self, query, limit):
+    prefix_postings = self._postings.get(" " + query[:2], ())
+    ranked = [self._get_match_key(site, query) for site in itertools.islice(prefix_postings, self._MAX_CANDIDATES) if site.lower().startswith(query)]
+    if len(ranked) >= limit:
+      return heapq.nsmallest(limit, ranked)
+    rarest = min([query[i:i + 3] for i in range(len(query) - 2)], key = lambda trigram: len(self._postings.get(trigram, ())))
+    candidates = itertools.islice(self._postings.get(rarest, ()), self._MAX_CANDIDATES)
+    ranked.extend([(2, 0, 0.0, len(site), site) for site in candidates if query in site.lower() and not site.lower().startswith(query)])
+    return heapq.nsmallest(limit, ranked)
+  
+  # Returns the ranking keys of the fuzzy matches of query that are not in found, ordered by edit distance (if measured), then trigram similarity
+  # Shared trigrams are counted (in C by collections.Counter) over the postings of the trigrams of the query, skipping trigrams in more than _MAX_CANDIDATES sites: such common trigrams (like "com") say little about a site, and the trigrams the best candidates share are counted exactly afterwards
+  def _get_similar_sites(self, query, found):
+    trigrams = self._get_trigrams(query)
+    needed = max(1, int(len(trigrams) * self._MIN_SHARED_RATIO + 0.5))
+    max_edits = self._get_max_edits(query)
+    candidate_needed = needed
+    if max_edits > 0:
+      candidate_needed = min(needed, self._EDIT_SHARED)
+    counts = collections.Counter()
+    skipped = 0
+    for trigram in trigrams:
+      postings = self._postings.get(trigram, ())
+      if len(postings) > self._MAX_CANDIDATES:
+        skipped += 1
+      else:
+        counts.update(postings)
+    candidate_needed = max(1, candidate_needed - skipped)
+    candidates = heapq.nlargest(self._MAX_FUZZY_CANDIDATES, [(shared, site) for site, shared in counts.items() if shared >= candidate_needed and not site in found])
+    ranked = []
+    for shared, site in candidates:
+      if skipped > 0:
+        shared = len(trigrams & self._get_trigrams(site))
+      # Jaccard similarity of the trigram sets, taking len(site) + 1 (the number of padded trigrams) as the size of the set of the site
+      similarity = shared / float(len(trigrams) + len(site) + 1 - shared)
+      edits = 0
+      if max_edits > 0:
+        edits = self._get_edit_distance(query, site.lower(), max_edits)
+      if edits <= max_edits or shared >= needed:
+        ranked.append((3, edits, -similarity, len(site), site))
+    return ranked
+  
+  # Returns the number of edits allowed between a query and a part of a site for an edit distance match (0 to match by shared trigrams only)
+  def _get_max_edits(self, query):
+    if len(query) < self._MIN_EDIT_QUERY:
+      return 0
+    if len(query) < 8:
+      return 1
+    return 2
+  
+  # Returns the smallest optimal string alignment distance (Levenshtein distance plus swaps of adjacent characters) between query and a part of site that starts at its start or after a separator and is one character shorter than, as long as or one character longer than query
+  # Distances over max_edits are all reported as max_edits + 1
+  def _get_edit_distance(self, query, site, max_edits):
+    best = max_edits + 1
+    starts = [0] + [i + 1 for i in range(len(site)) if site[i] in self._EDIT_SEPARATORS]
+    for start in starts:
+      part = site[start:start + len(query) + 1]
+      if len(part) < len(query) - 1:
+        continue
+      # rows[i][j] is the distance between the first i characters of query and the first j characters of part
+      rows = [list(range(len(part) + 1))]
+      for i in range(1, len(query) + 1):
+        row = [i] + [0] * len(part)
+        for j in range(1, len(part) + 1):
+          cost = 0 if query[i - 1] == part[j - 1] else 1
+          row[j] = min(rows[i - 1][j] + 1, row[j - 1] + 1, rows[i - 1][j - 1] + cost)
+          if i > 1 and j > 1 and query[i - 1] == part[j - 2] and query[i - 2] == part[j - 1]:
+            row[j] = min(row[j], rows[i - 2][j - 2] + 1)
+        rows.append(row)
+        if min(row) >= best:
+          # The distance cannot drop below the smallest entry of a row
+          break
+      else:
+        best = min([best] + rows[-1][max(0, len(query) - 1):])
+    return best
+  
+  # Returns the ranking keys of the best (up to limit) sites containing query (which has fewer than 3 characters), found through the trigrams that contain it
+  # The sites starting with the query (the postings of its padded first trigram) are ranked first; if they give limit matches, no other site can rank among the results
+  # Otherwise at most about _SHORT_QUERY_MAX_SITES sites are collected, since a very short query matches a large part of a big vault
+  def _get_short_query_matches(self, query, limit):
+    matches = self._postings.get(("  " + query)[-3:], ())
+    ranked = heapq.nsmallest(limit, [self._get_match_key(site, query) for site in itertools.islice(matches, self._SHORT_QUERY_MAX_SITES)])
+    if len(ranked) >= limit:
+      return ranked
+    matches = set(matches)
+    for trigram in self._postings:
+      if len(matches) >= self._SHORT_QUERY_MAX_SITES:
+        break
+      if query in trigram:
+        matches.update(self._postings[trigram])
+    return heapq.nsmallest(limit, [self._get_match_key(site, query) for site in matches])
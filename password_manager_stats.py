@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+# PasswordManagerStats
+# Low-overhead timers, counters and byte totals for the hot paths of the password manager
+
+# Class holding the process-wide statistics (all state is on the class, so every module shares it)
+# Instrumented code brackets its work like this:
+#   start = PasswordManagerStats.start()
+#   ...work...
+#   PasswordManagerStats.stop("crypto.encrypt", start, len(data))
+# While collection is off, start() returns None and stop() returns immediately, so nothing is timed or recorded
+# Collection is turned on with enable() or by setting the PASSWORD_MANAGER_STATS environment variable to 1
+class PasswordManagerStats(object):
+  # Constants
+  _ENV_VARIABLE = "PASSWORD_MANAGER_STATS"
+  
+  # Class variables (shared by every user of the statistics)
+  _enabled = os.environ.get(_ENV_VARIABLE, "") not in ("", "0")
+  _lock = threading.Lock()
+  _counters = {} # Name -> [count, seconds, bytes]
+  _sinks = []
+  _profiler = None
+  
+  # Turns collection on
+  @classmethod
+  def enable(cls):
+    cls._enabled = True
+  
+  # Turns collection off (collected values are kept until reset)
+  @classmethod
+  def disable(cls):
+    cls._enabled = False
+  
+  # Returns whether collection is on
+  @classmethod
+  def is_enabled(cls):
+    return cls._enabled
+  
+  # Returns a start time to pass to stop(), or None if collection is off
+  @classmethod
+  def start(cls):
+    if cls._enabled:
+      return time.perf_counter()
+    return None
+  
+  # Records one event called name that started at start (from start()) and processed byte_count bytes
+  # Does nothing if start is None (collection was off when the event started)
+  @classmethod
+  def stop(cls, name, start, byte_count=0):
+    if start == None:
+      return
+    seconds = time.perf_counter() - start
+    with cls._lock:
+      counter = cls._counters.get(name)
+      if counter == None:
+        counter = [0, 0.0, 0]
+        cls._counters[name] = counter
+      counter[0] += 1
+      counter[1] += seconds
+      counter[2] += byte_count
+      sinks = list(cls._sinks)
+    for sink in sinks:
+      sink(name, seconds, byte_count)
+  
+  # Returns a copy of the collected statistics: name -> dictionary with count, seconds and bytes keys
+  @classmethod
+  def snapshot(cls):
+    with cls._lock:
+      return dict([(name, {"count": counter[0], "seconds": counter[1], "bytes": counter[2]}) for name, counter in cls._counters.items()])
+  
+  # Clears the collected statistics
+  @classmethod
+  def reset(cls):
+    with cls._lock:
+      cls._counters = {}
+  
+  # Adds a sink: a callable taking (name, seconds, byte_count) that is called for every recorded event
+  @classmethod
+  def add_sink(cls, sink):
+    with cls._lock:
+      cls._sinks.append(sink)
+  
+  # Removes a sink added by add_sink
+  @classmethod
+  def remove_sink(cls, sink):
+    with cls._lock:
+      cls._sinks.remove(sink)
+  
+  # Starts a cProfile profiler (and turns collection on) so the instrumented calls can be inspected call by call
+  # cProfile is imported here so that it is only loaded when profiling
+  @classmethod
+  def start_profiler(cls):
+    if cls._profiler == None:
+      import cProfile
+      cls._profiler = cProfile.Profile()
+      cls._profiler.enable()
+    cls.enable()
+  
+  # Stops the profiler started by start_profiler and returns it (None if it was not running)
+  # If path is given, the profile is also written there for pstats or other profile viewers
+  @classmethod
+  def stop_profiler(cls, path=None):
+    profiler = cls._profiler
+    cls._profiler = None
+    if not profiler == None:
+      profiler.disable()
+      if not path == None:
+        profiler.dump_stats(path)
+    return profiler
@@ -0,0 +1,269 @@
+import base64
+import codecs
+import csv
+import io
+import json
+import os
+import struct
+import time
+from password_manager_container import PasswordManagerContainer
+from password_manager_crypto import PasswordManagerCrypto
+
+# PasswordManagerTransfer
+# Imports entries from CSV and JSON-lines files (such as exports of other password managers) and exports them again, optionally encrypted with a passphrase
+
+# Class to move entries between a PasswordManager and CSV or JSON-lines files
+# Files are streamed row by row in both directions, so memory use does not grow with the size of the file (beyond the entries held by the vault itself)
+# CSV files need a header row with a password column and a site column (site, url, name or title); JSON-lines files hold one object per line with the same keys; other columns are ignored
+# Encrypted exports start with _MAGIC, followed by the length of a JSON header (format, KDF parameters, salt and nonce), the header, the AES-GCM ciphertext of the export and its 16-byte tag
+# progress (optional) is called with a report dictionary (rows, bytes, seconds, rows_per_second and bytes_per_second keys) every _PROGRESS_ROWS rows and when a transfer ends
+class PasswordManagerTransfer(object):
+  # Constants
+  _TEXT_ENCODING = "UTF-8"
+  _FORMATS = ("csv", "jsonl")
+  _POLICIES = ("skip", "replace", "fail") # What an import does with a site that already has a password
+  _EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl"}
+  _ENCRYPTED_EXTENSION = ".enc"
+  _SITE_COLUMNS = ("site", "url", "name", "title") # Accepted names of the site column, in order of preference
+  _PASSWORD_COLUMN = "password"
+  _MAGIC = b"PMEXPORT"
+  _HEADER_LENGTH = struct.Struct(">I")
+  _TAG_LENGTH = 16
+  _EXPORT_KDF = {"algorithm": "PBKDF2-HMAC-SHA256", "iterations": 200000} # Exports can be attacked offline, so their key derivation is slower than the vault default
+  _READ_SIZE = 1024 * 1024
+  _WRITE_ROWS = 4096 # Number of rows written at a time by an export
+  _PROGRESS_ROWS = 10000
+  _MAX_ERRORS = 100 # Maximum number of row errors listed in the result of an import
+  
+  # Instance variables
+  _manager = None
+  _progress = None
+  
+  # Constructor
+  # manager is the unlocked PasswordManager to import into or export from
+  def __init__(self, manager, progress=None):
+    self._manager = manager
+    self._progress = progress
+  
+  # Returns the file format for path: file_format if given, otherwise the one matching the extension (ignoring a final .enc)
+  def _get_format(self, path, file_format):
+    if not file_format == None:
+      if not file_format in self._FORMATS:
+        raise ValueError("File format must be one of: " + ", ".join(self._FORMATS) + ".")
+      return file_format
+    root, extension = os.path.splitext(path.lower())
+    if extension == self._ENCRYPTED_EXTENSION:
+      extension = os.path.splitext(root)[1]
+    if not extension in self._EXTENSIONS:
+      raise ValueError("The file format cannot be told from the file name; give it as csv or jsonl.")
+    return self._EXTENSIONS[extension]
+  
+  # Reports progress if a progress callable was given
+  def _report(self, report, rows, byte_count, started):
+    seconds = time.perf_counter() - started
+    report["rows"] = rows
+    report["bytes"] = byte_count
+    report["seconds"] = seconds
+    report["rows_per_second"] = rows / seconds if seconds > 0 else None
+    report["bytes_per_second"] = byte_count / seconds if seconds > 0 else None
+    if not self._progress == None:
+      self._progress(dict(report))
+  
+  # Imports the entries of the file at path into the vault with a single save
+  # file_format is "csv" or "jsonl" (default: from the extension, or from the header of an encrypted export)
+  # policy decides what happens to a site that already has a password (in the vault or earlier in the file): "skip" keeps the existing password, "replace" overwrites it, "fail" aborts the import
+  # passphrase is needed for encrypted exports
+  # Rows with a missing or invalid site or password are counted as invalid and listed in the result (up to _MAX_ERRORS) without stopping the import
+  # If the import fails (including a "fail" duplicate or an encrypted file that does not authenticate), no entry is changed
+  # Returns the result: rows, imported, replaced, skipped, invalid, errors, bytes, seconds, rows_per_second and bytes_per_second keys
+  def import_file(self, path, file_format=None, policy="skip", passphrase=None):
+    if not policy in self._POLICIES:
+      raise ValueError("Policy must be one of: " + ", ".join(self._POLICIES) + ".")
+    result = {"imported": 0, "replaced": 0, "skipped": 0, "invalid": 0, "errors": []}
+    started = time.perf_counter()
+    rows = 0
+    input_handle = open(path, "rb")
+    try:
+      if input_handle.read(len(self._MAGIC)) == self._MAGIC:
+        if passphrase == None:
+          raise ValueError("The file is encrypted; a passphrase is needed to import it.")
+        file_format, lines, finish = self._open_encrypted(input_handle, file_format, passphrase)
+      else:
+        input_handle.seek(0)
+        file_format = self._get_format(path, file_format)
+        input_handle = io.TextIOWrapper(input_handle, encoding="utf-8-sig", newline="")
+        lines = input_handle
+        finish = None
+      with self._manager.batch():
+        for line_number, site, password, error in self._parse(lines, file_format):
+          rows += 1
+          if error == None:
+            error = self._check_entry(site, password)
+          if not error == None:
+            result["invalid"] += 1
+            if len(result["errors"]) < self._MAX_ERRORS:
+              result["errors"].append({"line": line_number, "error": error})
+          elif not self._manager.password_exists(site):
+            self._manager.set_password(site, password)
+            result["imported"] += 1
+          elif policy == "replace":
+            self._manager.set_password(site, password)
+            result["replaced"] += 1
+          elif policy == "skip":
+            result["skipped"] += 1
+          else:
+            raise ValueError("Line " + str(line_number) + ": a password for " + site + " already exists.")
+          if rows % self._PROGRESS_ROWS == 0:
+            self._report(result, rows, os.lseek(input_handle.fileno(), 0, os.SEEK_CUR), started)
+        if not finish == None:
+          finish()
+    finally:
+      input_handle.close()
+    self._report(result, rows, os.path.getsize(path), started)
+    return result
+  
+  # Returns an error message if site or password cannot be stored, otherwise None
+  def _check_entry(self, site, password):
+    if not isinstance(site, str) or len(site) == 0 or not self._manager.is_valid_string(site):
+      return "The site must be a nonempty string of lowercase letters, uppercase letters, numbers, and special keyboard characters."
+    if not isinstance(password, str) or len(password) == 0 or not self._manager.is_valid_string(password):
+      return "The password must be a nonempty string of lowercase letters, uppercase letters, numbers, and special keyboard characters."
+    return None
+  
+  # Yields (line number, site, password, error message or None) for each row read from lines (an iterable of text lines)
+  def _parse(self, lines, file_format):
+    if file_format == "csv":
+      reader = csv.reader(lines)
+      header = next(reader, None)
+      if header == None:
+        return
+      columns = [column.strip().lower() for column in header]
+      site_columns = [column for column in self._SITE_COLUMNS if column in columns]
+      if len(site_columns) == 0 or not self._PASSWORD_COLUMN in columns:
+        raise ValueError("The CSV file needs a header row with a password column and a site column (" + ", ".join(self._SITE_COLUMNS) + ").")
+      site_index = columns.index(site_columns[0])
+      password_index = columns.index(self._PASSWORD_COLUMN)
+      for row in reader:
+        if len(row) == 0:
+          continue
+        if len(row) <= max(site_index, password_index):
+          yield (reader.line_num, None, None, "The row has too few columns.")
+        else:
+          yield (reader.line_num, row[site_index], row[password_index], None)
+    else:
+      line_number = 0
+      for line in lines:
+        line_number += 1
+        if len(line.strip()) == 0:
+          continue
+        try:
+          row = json.loads(line)
+        except ValueError:
+          yield (line_number, None, None, "Invalid JSON.")
+          continue
+        if not isinstance(row, dict):
+          yield (line_number, None, None, "The line must hold a JSON object.")
+          continue
+        site = None
+        for column in self._SITE_COLUMNS:
+          if column in row:
+            site = row[column]
+            break
+        yield (line_number, site, row.get(self._PASSWORD_COLUMN), None)
+  
+  # Reads the header of an encrypted export (input_handle is positioned after the magic) and returns (file format, text lines, finish)
+  # The lines are decrypted as they are read; finish() checks the authentication tag once every line has been read and raises ValueError if it does not match
+  def _open_encrypted(self, input_handle, file_format, passphrase):
+    header_length = self._HEADER_LENGTH.unpack(input_handle.read(self._HEADER_LENGTH.size))[0]
+    header_bytes = input_handle.read(header_length)
+    header = json.loads(header_bytes.decode(self._TEXT_ENCODING))
+    if file_format == None:
+      file_format = header["format"]
+    cipher = PasswordManagerCrypto().new_passphrase_cipher(passphrase, base64.b64decode(header["salt"]), header["kdf"], base64.b64decode(header["nonce"]))
+    cipher.update(self._MAGIC + self._HEADER_LENGTH.pack(header_length) + header_bytes)
+    data_start = input_handle.tell()
+    data_end = os.fstat(input_handle.fileno()).st_size - self._TAG_LENGTH
+    if data_end < data_start:
+      raise ValueError("The encrypted file is truncated.")
+    input_handle.seek(data_end)
+    tag = input_handle.read(self._TAG_LENGTH)
+    input_handle.seek(data_start)
+    def finish():
+      try:
+        cipher.verify(tag)
+      except ValueError:
+        raise ValueError("The encrypted file could not be authenticated: the passphrase is wrong or the file is damaged.")
+    return (file_format, self._decrypt_lines(input_handle, cipher, data_end - data_start), finish)
+  
+  # Yields the text lines of length bytes of ciphertext read from input_handle, decrypted with cipher
+  def _decrypt_lines(self, input_handle, cipher, length):
+    decoder = codecs.getincrementaldecoder(self._TEXT_ENCODING)()
+    pending = ""
+    remaining = length
+    while remaining > 0:
+      data = input_handle.read(min(self._READ_SIZE, remaining))
+      if len(data) == 0:
+        raise ValueError("The encrypted file is truncated.")
+      remaining -= len(data)
+      try:
+        text = pending + decoder.decode(cipher.decrypt(data), remaining == 0)
+      except UnicodeDecodeError:
+        raise ValueError("The encrypted file could not be decrypted: the passphrase is wrong or the file is damaged.")
+      lines = text.split("\n")
+      pending = lines.pop()
+      for line in lines:
+        yield line + "\n"
+    if len(pending) > 0:
+      yield pending
+  
+  # Exports every entry of the vault, in order of site, to the file at path (replaced atomically; new files are only accessible by their owner)
+  # file_format is "csv" or "jsonl" (default: from the extension); if passphrase is given the export is encrypted with it
+  # Returns the result: rows, bytes, seconds, rows_per_second and bytes_per_second keys
+  def export_file(self, path, file_format=None, passphrase=None):
+    file_format = self._get_format(path, file_format)
+    result = {}
+    started = time.perf_counter()
+    chunks = self._make_export_chunks(file_format, result, started)
+    if not passphrase == None:
+      chunks = self._encrypt_chunks(chunks, file_format, passphrase)
+    byte_count = PasswordManagerContainer().write_atomic(path, chunks)
+    self._report(result, result["rows"], byte_count, started)
+    return result
+  
+  # Yields the export of every entry as encoded pieces of _WRITE_ROWS rows, counting the rows in result["rows"]
+  def _make_export_chunks(self, file_format, result, started):
+    rows = 0
+    byte_count = 0
+    buffer = io.StringIO()
+    if file_format == "csv":
+      writer = csv.writer(buffer, lineterminator="\n")
+      writer.writerow(["site", "password"])
+    for entry in self._manager.iter_passwords():
+      if file_format == "csv":
+        writer.writerow([entry["site"], entry["password"]])
+      else:
+        buffer.write(json.dumps({"site": entry["site"], "password": entry["password"]}) + "\n")
+      rows += 1
+      if rows % self._WRITE_ROWS == 0:
+        chunk = buffer.getvalue().encode(self._TEXT_ENCODING)
+        byte_count += len(chunk)
+        yield chunk
+        buffer.seek(0)
+        buffer.truncate()
+      if rows % self._PROGRESS_ROWS == 0:
+        self._report(result, rows, byte_count, started)
+    result["rows"] = rows
+    yield buffer.getvalue().encode(self._TEXT_ENCODING)
+  
+  # Yields the encrypted export: magic, header length, header, ciphertext of chunks and tag
+  def _encrypt_chunks(self, chunks, file_format, passphrase):
+    salt = os.urandom(32)
+    cipher = PasswordManagerCrypto().new_passphrase_cipher(passphrase, salt, self._EXPORT_KDF)
+    header = {"format": file_format, "kdf": self._EXPORT_KDF, "salt": base64.b64encode(salt).decode(self._TEXT_ENCODING), "nonce": base64.b64encode(cipher.nonce).decode(self._TEXT_ENCODING)}
+    header_bytes = json.dumps(header).encode(self._TEXT_ENCODING)
+    prefix = self._MAGIC + self._HEADER_LENGTH.pack(len(header_bytes)) + header_bytes
+    cipher.update(prefix)
+    yield prefix
+    for chunk in chunks:
+      yield cipher.encrypt(chunk)
+    yield cipher.digest()
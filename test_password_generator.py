@@ -0,0 +1,231 @@
+import random
+import unittest
+from password_generator import PasswordGenerator
+
+# Equivalence tests of PasswordGenerator
+# The generator is checked against a frozen copy of the original (quadratic-time) algorithm, which defines the passwords users already rely on
+
+# Frozen copy of PasswordGenerator as it was before the linear-time rewrite
+# Only change: random characters are drawn from the given random.Random instance instead of the shared random module, so that both generators can be seeded alike
+class _ReferencePasswordGenerator(object):
+  # Constants
+  _LOWERCASE_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+  _UPPERCASE_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+  _NUMBERS = "0123456789"
+  _SYMBOLS = "!\\" + '"' + "#$%&'()*+,-./:;<>=?@[\\]^_`{|}~"
+  _PHRASE_CHARS = _LOWERCASE_LETTERS + _UPPERCASE_LETTERS + _NUMBERS + _SYMBOLS
+  _CHAR_TYPE_DEFICIT_NUMBER = 2
+  
+  # Constructor
+  def __init__(self, rng):
+    self._random = rng
+  
+  def _get_random_character(self, char_str):
+    if not char_str == None:
+      return char_str[self._random.randint(0, len(char_str) - 1)]
+    else:
+      return None
+  
+  def is_valid_string(self, phrase):
+    for i in range(len(phrase)):
+      if self._PHRASE_CHARS.find(phrase[i]) == -1:
+        return False
+    return True
+  
+  def get_combined_site_and_phrase_string(self, site, phrase):
+    if len(site) < 1 or len(phrase) < 1:
+      raise ValueError("Parameters site and phrase cannot be empty.")
+    new_phrase = ""
+    phrase1 = ""
+    phrase2 = ""
+    if len(phrase) > len(site):
+      phrase1 = phrase
+      phrase2 = site
+    else:
+      phrase1 = site
+      phrase2 = phrase
+    j = 0
+    for i in range(len(phrase1)):
+      j = i % len(phrase2)
+      char_index = (self._PHRASE_CHARS.find(phrase1[i]) + self._PHRASE_CHARS.find(phrase2[j])) % len(self._PHRASE_CHARS)
+      new_phrase += self._PHRASE_CHARS[char_index]
+    return new_phrase
+  
+  def scramble_phrase(self, phrase):
+    if len(phrase) == 0:
+      return ""
+    str = ""
+    ranges = [[0, len(phrase) - 1]]
+    while len(ranges) > 0:
+      new_ranges = []
+      for i in range(len(ranges)):
+        low = ranges[i][0]
+        high = ranges[i][1]
+        mid = (low + high) // 2
+        str += phrase[mid]
+        new_low1 = low
+        new_high1 = mid - 1
+        new_low2 = mid + 1
+        new_high2 = high
+        if new_high1 >= new_low1:
+          new_ranges.append([new_low1, new_high1])
+        if new_high2 >= new_low2:
+          new_ranges.append([new_low2, new_high2])
+      ranges = new_ranges
+    return str
+  
+  def get_char_type_deficit(self, makeup):
+    keys = list(makeup.keys())
+    vals = list(makeup.values())
+    min_number = vals[0]
+    min_index = 0
+    max_number = vals[0]
+    max_index = 0
+    for i in range(len(makeup)):
+      if vals[i] < min_number:
+        min_number = vals[i]
+        min_index = i
+      if vals[i] > max_number:
+        max_number = vals[i]
+        max_index = i
+    if max_number - min_number >= self._CHAR_TYPE_DEFICIT_NUMBER:
+      return keys[min_index]
+    else:
+      return ""
+  
+  def sum_phrase_indices_odd_or_even(self, phrase):
+    if not self.is_valid_string(phrase):
+      raise ValueError("String must consist solely of lowercase letters, uppercase letters, numbers, and symbols.")
+    sum = 0
+    i = len(phrase) % 2
+    while i <= len(phrase) - 1:
+      sum += self._PHRASE_CHARS.find(phrase[i])
+      i += 2
+    return sum
+  
+  def get_char_type(self, char_arg):
+    if not len(char_arg) == 1:
+      raise ValueError("Not a character.")
+    if self._LOWERCASE_LETTERS.find(char_arg) > -1:
+      return "lowercase"
+    elif self._UPPERCASE_LETTERS.find(char_arg) > -1:
+      return "uppercase"
+    elif self._NUMBERS.find(char_arg) > -1:
+      return "numbers"
+    elif self._SYMBOLS.find(char_arg) > -1:
+      return "symbols"
+  
+  def make_password(self, length, site, phrase):
+    if length < 1 or not self.is_valid_string(site) or len(site) < 1 or not self.is_valid_string(phrase) or len(phrase) < 1:
+      raise ValueError("Length must be at least 1, and site and phrase must consist only of lowercase letters, uppercase letters, numbers, and special keyboard characters.")
+    material = self.scramble_phrase(self.get_combined_site_and_phrase_string(site, phrase))
+    password = ""
+    phrase_index = 0
+    symbol_types = {"lowercase": 0, "uppercase": 0, "numbers": 0, "symbols": 0}
+    for i in range(length):
+      deficit = self.get_char_type_deficit(symbol_types)
+      char_to_insert = ""
+      password_sum = self.sum_phrase_indices_odd_or_even(password)
+      if deficit == "lowercase":
+        char_to_insert = self._get_random_character(self._LOWERCASE_LETTERS)
+      elif deficit == "uppercase":
+        char_to_insert = self._get_random_character(self._UPPERCASE_LETTERS)
+      elif deficit == "numbers":
+        char_to_insert = self._get_random_character(self._NUMBERS)
+      elif deficit == "symbols":
+        char_to_insert = self._get_random_character(self._SYMBOLS)
+      else:
+        char_to_insert = material[phrase_index]
+        phrase_index += 1
+      password += char_to_insert
+      symbol_types[self.get_char_type(char_to_insert)] += 1
+      if phrase_index == len(material):
+        phrase_index = 0
+        phrase_offset = max(1, abs((self._PHRASE_CHARS.find(material[0]) - self._PHRASE_CHARS.find(material[len(material) - 1]))) // 2)
+        new_material = ""
+        for k in range(len(material)):
+          new_material += self._PHRASE_CHARS[(self._PHRASE_CHARS.find(material[k]) + phrase_offset) % len(self._PHRASE_CHARS)]
+        material = new_material
+    return password
+
+class PasswordGeneratorEquivalenceTest(unittest.TestCase):
+  # Constants
+  _SEED = 20240611
+  _CASES = 500
+  _LONG_LENGTHS = (1000, 2500)
+  _OTHER_CHARS = " é\t€" # Characters outside the phrase characters
+  
+  # Returns a random string of length characters, drawn from the phrase characters and (if invalid is true) some other characters
+  def _make_string(self, rng, length, invalid=False):
+    chars = PasswordGenerator._PHRASE_CHARS
+    if invalid:
+      chars += self._OTHER_CHARS
+    return "".join([rng.choice(chars) for i in range(length)])
+  
+  # Checks that make_password returns the same passwords and draws the same random numbers as the reference for seeded random inputs
+  def test_make_password(self):
+    rng = random.Random(self._SEED)
+    for case in range(self._CASES):
+      length = rng.randint(1, 64)
+      site = self._make_string(rng, rng.randint(1, 24))
+      phrase = self._make_string(rng, rng.randint(1, 24))
+      seed = rng.getrandbits(32)
+      generator_rng = random.Random(seed)
+      reference_rng = random.Random(seed)
+      self.assertEqual(PasswordGenerator(generator_rng).make_password(length, site, phrase), _ReferencePasswordGenerator(reference_rng).make_password(length, site, phrase), (length, site, phrase))
+      self.assertEqual(generator_rng.getstate(), reference_rng.getstate())
+  
+  # Checks make_password for long passwords, which wrap the seed material many times
+  def test_make_password_long(self):
+    rng = random.Random(self._SEED + 1)
+    for length in self._LONG_LENGTHS:
+      site = self._make_string(rng, rng.randint(1, 24))
+      phrase = self._make_string(rng, rng.randint(1, 24))
+      self.assertEqual(PasswordGenerator(random.Random(length)).make_password(length, site, phrase), _ReferencePasswordGenerator(random.Random(length)).make_password(length, site, phrase))
+  
+  # Checks that both generators reject the same invalid arguments
+  def test_make_password_invalid(self):
+    for length, site, phrase in ((0, "site", "phrase"), (10, "", "phrase"), (10, "site", ""), (10, "séte", "phrase"), (10, "site", "phr ase")):
+      self.assertRaises(ValueError, PasswordGenerator().make_password, length, site, phrase)
+      self.assertRaises(ValueError, _ReferencePasswordGenerator(random.Random()).make_password, length, site, phrase)
+  
+  # Checks get_combined_site_and_phrase_string, including characters outside the phrase characters (which the original treated as index -1)
+  def test_get_combined_site_and_phrase_string(self):
+    rng = random.Random(self._SEED + 2)
+    generator = PasswordGenerator()
+    reference = _ReferencePasswordGenerator(rng)
+    for case in range(self._CASES):
+      site = self._make_string(rng, rng.randint(1, 40), True)
+      phrase = self._make_string(rng, rng.randint(1, 40), True)
+      self.assertEqual(generator.get_combined_site_and_phrase_string(site, phrase), reference.get_combined_site_and_phrase_string(site, phrase))
+    self.assertRaises(ValueError, generator.get_combined_site_and_phrase_string, "", "phrase")
+  
+  # Checks scramble_phrase for every length up to 300
+  def test_scramble_phrase(self):
+    rng = random.Random(self._SEED + 3)
+    generator = PasswordGenerator()
+    reference = _ReferencePasswordGenerator(rng)
+    for length in range(301):
+      phrase = self._make_string(rng, length)
+      self.assertEqual(generator.scramble_phrase(phrase), reference.scramble_phrase(phrase))
+  
+  # Checks get_char_type for every phrase character and some other characters
+  def test_get_char_type(self):
+    generator = PasswordGenerator()
+    reference = _ReferencePasswordGenerator(random.Random())
+    for char in PasswordGenerator._PHRASE_CHARS + self._OTHER_CHARS:
+      self.assertEqual(generator.get_char_type(char), reference.get_char_type(char))
+    for char_arg in ("", "ab"):
+      self.assertRaises(ValueError, generator.get_char_type, char_arg)
+  
+  # Checks is_valid_string for random strings with and without other characters
+  def test_is_valid_string(self):
+    rng = random.Random(self._SEED + 4)
+    generator = PasswordGenerator()
+    reference = _ReferencePasswordGenerator(rng)
+    for case in range(self._CASES):
+      phrase = self._make_string(rng, rng.randint(0, 20), rng.random() < 0.5)
+      self.assertEqual(generator.is_valid_string(phrase), reference.is_valid_string(phrase))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,180 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+from password_manager import PasswordManager
+from password_manager_container import PasswordManagerContainer
+from password_manager_entry import PasswordManagerEntry
+
+# Tests of PasswordManager
+
+class PasswordManagerTest(unittest.TestCase):
+  # Constants
+  _FORMATS = ("json", "journal")
+  
+  # Creates a directory for the vaults of a test
+  def setUp(self):
+    self._directory = tempfile.mkdtemp()
+    self._path = os.path.join(self._directory, "vault")
+  
+  # Removes the vaults of a test
+  def tearDown(self):
+    shutil.rmtree(self._directory)
+  
+  # Returns the encrypted entries of the vault file at path and the contents of its journal (None if there is none)
+  def _read_ciphertext(self, path):
+    with PasswordManagerContainer().read(path) as (container, fields, size):
+      enc_passwords = bytes(fields["enc_passwords"])
+    journal = None
+    if os.path.isfile(path + PasswordManager._JOURNAL_SUFFIX):
+      journal_handle = open(path + PasswordManager._JOURNAL_SUFFIX, "rb")
+      journal = journal_handle.read()
+      journal_handle.close()
+    return (enc_passwords, journal)
+  
+  # Returns the entries of the vault at path as sorted (site, password) pairs
+  def _read_entries(self, path, master_password):
+    return sorted([(entry["site"], entry["password"]) for entry in PasswordManager(path, master_password).get_passwords()])
+  
+  # A failed journal compaction must not undo or report as failed changes that were already appended to the journal
+  def test_failed_compaction_keeps_saved_changes(self):
+    manager = PasswordManager(self._path, "pw", vault_format="journal")
+    manager.generate_password(12, "a", "phrase")
+    manager._COMPACT_MAX_BYTES = 0
+    write = manager._container.write
+    def fail_write(*args):
+      raise OSError(28, "No space left on device")
+    manager._container.write = fail_write
+    with manager.batch():
+      manager.generate_password(12, "b", "phrase")
+    manager.generate_password(12, "c", "phrase")
+    self.assertTrue(manager.password_exists("b"))
+    manager._container.write = write
+    manager.generate_password(12, "d", "phrase")
+    self.assertEqual(manager.get_generation(), 2)
+    reopened = PasswordManager(self._path, "pw")
+    self.assertEqual([entry["site"] for entry in reopened.get_passwords()], ["a", "b", "c", "d"])
+  
+  # Malformed requests get an error result of their own instead of failing the whole call
+  def test_generate_passwords_reports_malformed_requests(self):
+    manager = PasswordManager(self._path, "pw")
+    results = manager.generate_passwords([(12, "a", "phrase"), (12, "b"), "c", ("10", "d", "phrase"), (12, 5, "phrase"), (0, "e", "phrase")], executor="thread")
+    self.assertEqual(results[0]["site"], "a")
+    self.assertTrue("password" in results[0])
+    self.assertEqual([result["site"] for result in results[1:]], [None, None, "d", 5, "e"])
+    self.assertTrue(all(["error" in result for result in results[1:]]))
+    self.assertEqual([entry["site"] for entry in manager.get_passwords()], ["a"])
+  
+  # set_password stores given passwords, sealed with per-entry encryption, and inside a batch the vault is saved once when it commits
+  def test_set_password(self):
+    manager = PasswordManager(self._path, "pw", entry_encryption=True)
+    with manager.batch():
+      manager.set_password("a", "first")
+      manager.set_password("b", "second")
+      manager.set_password("a", "third")
+      self.assertEqual(manager.get_generation(), 1)
+    self.assertEqual(manager.get_generation(), 2)
+    self.assertEqual(manager.get_saves_avoided(), 2)
+    self.assertRaises(ValueError, manager.set_password, "", "password")
+    self.assertRaises(ValueError, manager.set_password, "c", None)
+    self.assertFalse(manager.get_passwords()[0]["password"] == manager._passwords[0].password)
+    reopened = PasswordManager(self._path, "pw")
+    self.assertEqual(sorted([(entry["site"], entry["password"]) for entry in reopened.get_passwords()]), [("a", "third"), ("b", "second")])
+  
+  # Entries handed out by the vault are read-only, and storing an entry for a known site does not change the entry given
+  def test_entries_are_read_only(self):
+    manager = PasswordManager(self._path, "pw")
+    manager.set_password("site", "first")
+    entry = next(manager.iter_passwords())
+    with self.assertRaises(AttributeError):
+      entry.password = "changed"
+    with self.assertRaises(AttributeError):
+      entry.site = "z"
+    given = PasswordManagerEntry("".join(["si", "te"]), "second")
+    manager._put_entry(given)
+    self.assertFalse(given.site is manager._sorted_sites[0])
+    self.assertTrue(next(manager.iter_passwords()).site is manager._sorted_sites[0])
+    self.assertEqual(copy.copy(given), {"site": "site", "password": "second"})
+  
+  # Changing the master password only replaces the key envelope: the old password is rejected, the new one opens the vault, and the encrypted entries and journal are unchanged
+  def test_change_master_password(self):
+    for vault_format in self._FORMATS:
+      path = os.path.join(self._directory, vault_format)
+      manager = PasswordManager(path, "old", vault_format=vault_format)
+      manager.set_password("a", "first")
+      manager.set_password("b", "second")
+      manager.delete_password("a")
+      ciphertext = self._read_ciphertext(path)
+      manager.change_master_password("old", "new", kdf_iterations=manager.get_kdf()["iterations"] + 1)
+      self.assertEqual(self._read_ciphertext(path), ciphertext)
+      self.assertRaises(ValueError, PasswordManager, path, "old")
+      self.assertEqual(self._read_entries(path, "new"), [("b", "second")])
+      self.assertRaises(ValueError, manager.change_master_password, "old", "other")
+      self.assertRaises(ValueError, manager.change_master_password, "new", "")
+      manager.set_password("c", "third")
+      self.assertEqual(self._read_entries(path, "new"), [("b", "second"), ("c", "third")])
+  
+  # Rotating the data key re-encrypts the vault under a new key for both vault formats, with and without per-entry encryption
+  def test_rotate_data_key(self):
+    for vault_format in self._FORMATS:
+      for entry_encryption in (False, True):
+        path = os.path.join(self._directory, vault_format + str(entry_encryption))
+        manager = PasswordManager(path, "pw", vault_format=vault_format, entry_encryption=entry_encryption)
+        manager.set_password("a", "first")
+        manager.set_password("b", "second")
+        manager.delete_password("a")
+        enc_key = manager._enc_key
+        ciphertext = self._read_ciphertext(path)
+        manager.rotate_data_key()
+        self.assertFalse(manager._enc_key == enc_key)
+        self.assertFalse(self._read_ciphertext(path)[0] == ciphertext[0])
+        self.assertEqual(manager.get_passwords(), [{"site": "b", "password": "second"}])
+        self.assertEqual(self._read_entries(path, "pw"), [("b", "second")])
+        manager.set_password("c", "third")
+        self.assertEqual(self._read_entries(path, "pw"), [("b", "second"), ("c", "third")])
+  
+  # A rotation whose streamed write fails leaves the old key in use and the vault file readable with it
+  def test_failed_rotation_keeps_old_key(self):
+    manager = PasswordManager(self._path, "pw", entry_encryption=True)
+    manager.set_password("a", "first")
+    enc_key = manager._enc_key
+    ciphertext = self._read_ciphertext(self._path)
+    def fail_write_streamed(*args):
+      raise OSError(28, "No space left on device")
+    manager._container.write_streamed = fail_write_streamed
+    self.assertRaises(OSError, manager.rotate_data_key)
+    self.assertEqual(manager._enc_key, enc_key)
+    self.assertEqual(self._read_ciphertext(self._path), ciphertext)
+    self.assertEqual(manager.get_password("a"), "first")
+    manager.set_password("b", "second")
+    self.assertEqual(self._read_entries(self._path, "pw"), [("a", "first"), ("b", "second")])
+  
+  # Two instances of one vault merge their saves: a stale instance keeps the changes the other saved, its own changes win for a site both changed, and the generation advances with the writes of either instance
+  def test_stale_instance_merges_saves(self):
+    for vault_format in self._FORMATS:
+      path = os.path.join(self._directory, vault_format)
+      first = PasswordManager(path, "pw", vault_format=vault_format)
+      first.set_password("shared", "original")
+      first.set_password("deleted", "password")
+      second = PasswordManager(path, "pw", vault_format=vault_format)
+      generation = first.get_generation()
+      with first.batch():
+        first.set_password("a", "first")
+        first.set_password("shared", "from-first")
+      with second.batch():
+        second.set_password("b", "second")
+        second.set_password("shared", "from-second")
+        second.delete_password("deleted")
+      expected = [("a", "first"), ("b", "second"), ("shared", "from-second")]
+      self.assertEqual(sorted([(entry["site"], entry["password"]) for entry in second.get_passwords()]), expected)
+      self.assertEqual(self._read_entries(path, "pw"), expected)
+      # Journal appends keep the snapshot and its generation; compaction writes a new one
+      second.compact_vault()
+      self.assertTrue(second.get_generation() > generation)
+      first.refresh()
+      self.assertEqual(sorted([(entry["site"], entry["password"]) for entry in first.get_passwords()]), expected)
+      self.assertEqual(first.get_generation(), second.get_generation())
+
+if __name__ == "__main__":
+  unittest.main()
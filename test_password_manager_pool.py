@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from password_manager import PasswordManager
+from password_manager_pool import VaultPool
+
+# Tests of VaultPool
+
+class VaultPoolTest(unittest.TestCase):
+  # Constants
+  _THREADS = 4
+  _WRITES = 100 # Writes per thread
+  _IDLE_TIMEOUT = 0.2 # Seconds
+  
+  # Creates a directory for the vaults of a test
+  def setUp(self):
+    self._directory = tempfile.mkdtemp()
+    self._path = os.path.join(self._directory, "vault")
+  
+  # Removes the vaults of a test
+  def tearDown(self):
+    shutil.rmtree(self._directory)
+  
+  # Runs target in _THREADS threads and reraises the first error raised in one of them
+  def _run_threads(self, target):
+    errors = []
+    def run(thread_index):
+      try:
+        target(thread_index)
+      except BaseException as e:
+        errors.append(e)
+    threads = [threading.Thread(target=run, args=(thread_index,)) for thread_index in range(self._THREADS)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    if len(errors) > 0:
+      raise errors[0]
+  
+  # Borrowers of one vault in several threads take turns, so that no write is lost
+  def test_concurrent_borrowers_keep_every_write(self):
+    pool = VaultPool()
+    with pool.vault(self._path, "pw") as manager:
+      manager.generate_password(12, "first", "phrase")
+    def write(thread_index):
+      for i in range(self._WRITES):
+        with pool.vault(self._path, "pw") as manager:
+          manager.generate_password(12, "site" + str(thread_index) + "-" + str(i), "phrase")
+    self._run_threads(write)
+    pool.close()
+    self.assertEqual(len(PasswordManager(self._path, "pw").get_passwords()), self._THREADS * self._WRITES + 1)
+  
+  # A borrower that discards the vault does not leave the borrowers waiting for it with a closed manager
+  def test_discard_while_others_wait(self):
+    pool = VaultPool()
+    with pool.vault(self._path, "pw") as manager:
+      manager.generate_password(12, "first", "phrase")
+    def write(thread_index):
+      for i in range(self._WRITES // 4):
+        manager = pool.acquire(self._path, "pw")
+        manager.generate_password(12, "site" + str(thread_index) + "-" + str(i), "phrase")
+        pool.release(manager, discard=(i % 3 == 0))
+    self._run_threads(write)
+    pool.close()
+    self.assertEqual(len(PasswordManager(self._path, "pw").get_passwords()), self._THREADS * (self._WRITES // 4) + 1)
+  
+  # After the master password is changed through a pooled manager, the old password no longer unlocks the cached vault and the new one does
+  def test_change_master_password_through_pool(self):
+    pool = VaultPool()
+    with pool.vault(self._path, "old") as manager:
+      manager.generate_password(12, "site", "phrase")
+      manager.change_master_password("old", "new")
+    self.assertRaises(ValueError, pool.acquire, self._path, "old")
+    with pool.vault(self._path, "new") as manager:
+      self.assertEqual([entry["site"] for entry in manager.get_passwords()], ["site"])
+    pool.close()
+  
+  # Idle vaults are evicted without further calls to the pool
+  def test_idle_vaults_are_evicted_in_background(self):
+    pool = VaultPool(idle_timeout=self._IDLE_TIMEOUT)
+    with pool.vault(self._path, "pw") as manager:
+      manager.generate_password(12, "site", "phrase")
+    time.sleep(self._IDLE_TIMEOUT * 3)
+    self.assertEqual(pool.get_stats()["vaults"], 0)
+    self.assertEqual(pool.get_stats()["expirations"], 1)
+    pool.close()
+
+if __name__ == "__main__":
+  unittest.main()
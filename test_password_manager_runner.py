@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+import unittest
+from password_manager_benchmark import PasswordManagerBenchmark
+
+# Startup tests of the runner
+# The runner defers its heavy imports until a command needs them (see the Startup section of the README); these tests fail if that regresses
+
+class PasswordManagerRunnerStartupTest(unittest.TestCase):
+  # Constants
+  _DEFERRED_MODULES = ("argparse", "json", "concurrent.futures", "Cryptodome", "password_generator", "password_manager", "password_manager_crypto", "password_manager_cli", "password_manager_agent_client") # Modules that importing the runner must not import
+  
+  # Checks that importing the runner, measured with python -X importtime, stays within the startup budget
+  def test_import_within_budget(self):
+    benchmark = PasswordManagerBenchmark(3, False)
+    self.assertTrue(benchmark.bench_startup(PasswordManagerBenchmark._STARTUP_BUDGET_MS), "Importing the runner exceeds the startup budget.")
+  
+  # Checks that importing the runner leaves the modules only some commands need unimported
+  def test_import_defers_modules(self):
+    code = "import sys, password_manager_runner; print(' '.join(sorted(sys.modules)))"
+    completed = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    imported = completed.stdout.split()
+    for module in self._DEFERRED_MODULES:
+      self.assertFalse(module in imported, module + " is imported with the runner.")
+
+if __name__ == "__main__":
+  unittest.main()
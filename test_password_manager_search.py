@@ -0,0 +1,54 @@
+import random
+import unittest
+from password_manager_search import PasswordManagerSearchIndex
+
+# Tests of PasswordManagerSearchIndex
+
+class PasswordManagerSearchIndexTest(unittest.TestCase):
+  # Constants
+  _SEED = 16
+  _SITES = ("github.com", "gitlab.com", "google.com", "accounts.google.com", "mail.yahoo.com", "Example.org")
+  
+  # Returns the sites containing query, ranked like search() ranks them: exact match, prefix match, then shorter sites first
+  def _rank_substring_matches(self, sites, query, limit):
+    keys = []
+    for site in sites:
+      lower_site = site.lower()
+      if query in lower_site:
+        keys.append((0 if lower_site == query else 1 if lower_site.startswith(query) else 2, len(site), site))
+    return [key[-1] for key in sorted(keys)[:limit]]
+  
+  # Substring results match a full ranking of every site while the candidates stay under the caps
+  def test_substring_ranking(self):
+    rng = random.Random(self._SEED)
+    letters = "abcdefgh"
+    sites = set()
+    while len(sites) < 2000:
+      sites.add("".join([rng.choice(letters + letters.upper()) for i in range(rng.randint(2, 9))]) + rng.choice(("", ".com", ".io")))
+    index = PasswordManagerSearchIndex(sites)
+    for case in range(500):
+      query = "".join([rng.choice(letters) for i in range(rng.randint(1, 5))])
+      expected = self._rank_substring_matches(sites, query, 10)
+      self.assertEqual(index.search(query, 10)[:len(expected)], expected, query)
+  
+  # Misspellings that change most trigrams of a short query are found by edit distance
+  def test_misspellings(self):
+    index = PasswordManagerSearchIndex(self._SITES)
+    self.assertEqual(index.search("gihtub", 1), ["github.com"])
+    self.assertEqual(index.search("gogle", 1), ["google.com"])
+    self.assertEqual(index.search("acounts", 1), ["accounts.google.com"])
+    self.assertEqual(index.search("gitlba", 1), ["gitlab.com"])
+    self.assertEqual(index.search("exmaple", 1), ["Example.org"])
+    self.assertEqual(index.search("amazon"), [])
+  
+  # A query contained in more sites than are examined still returns limit results, prefix matches first
+  def test_common_query(self):
+    sites = ["site" + str(i) + ".com" for i in range(3 * PasswordManagerSearchIndex._MAX_CANDIDATES)] + ["company.org"]
+    index = PasswordManagerSearchIndex(sites)
+    results = index.search("com", 10)
+    self.assertEqual(len(results), 10)
+    self.assertEqual(results[0], "company.org")
+    self.assertTrue(all(["com" in site for site in results]))
+
+if __name__ == "__main__":
+  unittest.main()